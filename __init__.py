@@ -1,14 +1,18 @@
 from .prompt_db import PromptDB
-from .prompt_stack import PromptStack
+from .prompt_stack import PromptStack, PromptStackSweep
+from . import prompt_bulk  # registers the bulk import/export routes
+from . import prompt_events  # pushes library changes to the browser
 
 NODE_CLASS_MAPPINGS = {
     "PromptDB": PromptDB,
-    "PromptStack": PromptStack
+    "PromptStack": PromptStack,
+    "PromptStackSweep": PromptStackSweep
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "PromptDB": "Prompt Database",
-    "PromptStack": "Prompt Stack"
+    "PromptStack": "Prompt Stack",
+    "PromptStackSweep": "Prompt Stack (Sweep)"
 }
 
 # Web directory for ComfyUI to serve JavaScript files
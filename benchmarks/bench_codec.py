@@ -0,0 +1,104 @@
+"""Benchmarks for the JSON codecs used to read and write prompts.json.
+
+Times parsing and serializing (indented and compact) a synthetic library with
+every codec installed (orjson, msgspec, json), and prints JSON results with
+the speedup over the standard library, e.g.
+
+    python benchmarks/bench_codec.py --sizes 10000,100000 --output codecs.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib.util
+
+from bench_prompt_db import PACKAGE_DIR, make_library
+
+
+def load_codec_module():
+    """prompt_codec has no package-relative imports, so it can be loaded on its own"""
+    spec = importlib.util.spec_from_file_location("prompt_codec", os.path.join(PACKAGE_DIR, "prompt_codec.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def best_of(call, repeat):
+    """Fastest of repeat runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def run_size(prompt_codec, size, repeat):
+    prompts_db = make_library(size)
+    pretty_payload = prompt_codec.get_codec("json").dumps(prompts_db, pretty=True)
+    compact_payload = prompt_codec.get_codec("json").dumps(prompts_db)
+    result = {
+        "size": size,
+        "pretty_bytes": len(pretty_payload),
+        "compact_bytes": len(compact_payload),
+        "codecs": {},
+    }
+    for name in prompt_codec.available_codecs():
+        codec = prompt_codec.get_codec(name)
+        assert codec.loads(pretty_payload) == prompts_db
+        result["codecs"][name] = {
+            "parse_pretty_ms": best_of(lambda: codec.loads(pretty_payload), repeat),
+            "parse_compact_ms": best_of(lambda: codec.loads(compact_payload), repeat),
+            "serialize_pretty_ms": best_of(lambda: codec.dumps(prompts_db, pretty=True), repeat),
+            "serialize_compact_ms": best_of(lambda: codec.dumps(prompts_db), repeat),
+        }
+    baseline = result["codecs"]["json"]
+    for timings in result["codecs"].values():
+        timings["speedup"] = {
+            key.replace("_ms", ""): baseline[key] / timings[key] for key in baseline if key.endswith("_ms")
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,500000",
+                        help="comma-separated library sizes (number of prompts)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the fastest is reported")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    prompt_codec = load_codec_module()
+    results = []
+    for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+        print(f"Benchmarking codecs on {size} prompts...", file=sys.stderr)
+        result = run_size(prompt_codec, size, args.repeat)
+        results.append(result)
+        for name, timings in result["codecs"].items():
+            print(f"{size:>8} {name:>8}  parse {timings['parse_pretty_ms']:8.1f} ms  "
+                  f"serialize {timings['serialize_pretty_ms']:8.1f} ms  "
+                  f"(x{timings['speedup']['parse_pretty']:.1f} / x{timings['speedup']['serialize_pretty']:.1f})",
+                  file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "codecs": prompt_codec.available_codecs(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
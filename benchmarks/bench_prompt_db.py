@@ -0,0 +1,331 @@
+"""Benchmarks for the prompt database routes, INPUT_TYPES and prompt stacking.
+
+Generates synthetic prompt libraries and drives the package's real aiohttp
+handlers and node classes through stub ComfyUI modules (benchmarks/stubs), then
+prints machine-readable JSON results. Run from the package directory, e.g.
+
+    python benchmarks/bench_prompt_db.py --sizes 1000,10000 --output results.json
+
+Each library size runs in its own subprocess, so peak RSS and caches are per
+size. Only aiohttp is needed and nothing touches the network beyond localhost.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import importlib.util
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+PACKAGE_NAME = "comfy_prompt_db"
+
+ADJECTIVES = ["soft", "dramatic", "golden", "moody", "vivid", "misty", "neon", "rustic", "serene", "gritty",
+              "pastel", "cinematic", "dusky", "bright", "ancient", "futuristic", "quiet", "stormy", "warm", "cold"]
+NOUNS = ["portrait", "landscape", "forest", "city", "studio", "harbor", "desert", "castle", "garden", "street",
+         "mountain", "interior", "ocean", "village", "market", "library", "bridge", "meadow", "alley", "temple"]
+WORDS = ["lighting", "shadows", "detailed", "texture", "composition", "bokeh", "film", "grain", "sharp", "focus",
+         "colour", "palette", "mood", "atmosphere", "depth", "field", "wide", "angle", "closeup", "masterpiece",
+         "quality", "ultra", "render", "photo", "painting", "sketch", "ink", "watercolor", "oil", "canvas",
+         "rim", "light", "volumetric", "fog", "reflections", "symmetry", "rule", "thirds", "hdr", "8k"]
+
+
+def make_library(size, seed=0):
+    """Build a prompts.json-style dict with size prompts.
+
+    A fifth of the prompts go to one large category so listing a big category
+    is measured too; the rest are spread over the other categories.
+    """
+    rng = random.Random(seed)
+    category_count = max(5, min(200, size // 500))
+    categories = [f"category {i:03d}" for i in range(category_count)]
+    prompts_db = {category: {} for category in categories}
+    for i in range(size):
+        category = categories[0] if i % 5 == 0 else categories[1 + i % (category_count - 1)]
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+        prompts_db[category][name] = ", ".join(rng.choices(WORDS, k=rng.randint(8, 16)))
+    return prompts_db
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def bytes_written():
+    """Bytes this process has passed to write() so far (Linux only, else None)"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def load_package(base_path):
+    """Import the package against the stub ComfyUI modules, with its database under base_path"""
+    sys.path.insert(0, os.path.join(BENCH_DIR, "stubs"))
+    import folder_paths
+    folder_paths.base_path = base_path
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"), submodule_search_locations=[PACKAGE_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+async def time_calls(call, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def time_sync(call, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def run_size(size, args):
+    """Benchmark one library size and return its results dict"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+
+    base_path = tempfile.mkdtemp(prefix="prompt-db-bench-")
+    db_dir = os.path.join(base_path, "user", "default", "user-db")
+    os.makedirs(db_dir)
+    rng = random.Random(args.seed + 1)
+
+    start = time.perf_counter()
+    prompts_db = make_library(size, args.seed)
+    payload = json.dumps(prompts_db, indent=2, ensure_ascii=False).encode('utf-8')
+    with open(os.path.join(db_dir, "prompts.json"), 'wb') as f:
+        f.write(payload)
+    result = {
+        "size": size,
+        "categories": len(prompts_db),
+        "file_bytes": len(payload),
+        "generate_s": time.perf_counter() - start,
+    }
+    pairs = [(category, name) for category, category_prompts in prompts_db.items() for name in category_prompts]
+    largest_category = next(iter(prompts_db))
+    del payload
+
+    package = load_package(base_path)
+    prompt_db = sys.modules[f"{PACKAGE_NAME}.prompt_db"]
+    PromptDB, PromptStack = package.PromptDB, package.PromptStack
+
+    start = time.perf_counter()
+    store = prompt_db.get_prompt_store()
+    store.categories()
+    result["cold_load_ms"] = (time.perf_counter() - start) * 1000
+
+    # INPUT_TYPES as called when ComfyUI builds /object_info
+    start = time.perf_counter()
+    PromptDB.INPUT_TYPES()
+    PromptStack.INPUT_TYPES()
+    result["input_types_cold_ms"] = (time.perf_counter() - start) * 1000
+    result["input_types"] = time_sync(lambda: (PromptDB.INPUT_TYPES(), PromptStack.INPUT_TYPES()), args.iterations)
+
+    # Stacking five entries, as the node does on every execution
+    node = PromptStack()
+    stack_inputs = {}
+    for i, (category, name) in enumerate(rng.sample(pairs, 5), 1):
+        stack_inputs[f"prompt_{i}_category"] = category
+        stack_inputs[f"prompt_{i}_name"] = name
+        stack_inputs[f"prompt_{i}_enabled"] = True
+    result["stack_prompts"] = time_sync(lambda: node.stack_prompts(", ", "", **stack_inputs), args.iterations)
+    edit_samples = []
+    for i in range(min(args.iterations, 50)):
+        # Any edit changes the library version, so the next stack starts cold
+        store.set_prompt(largest_category, f"bench edit {i % 5}", "edited")
+        start = time.perf_counter()
+        node.stack_prompts(", ", "", **stack_inputs)
+        edit_samples.append(time.perf_counter() - start)
+    store.flush()
+    result["stack_prompts_after_edit"] = summarize(edit_samples)
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.add_routes(sys.modules["server"].PromptServer.instance.routes)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    try:
+        async def post(route, body):
+            response = await client.post(route, json=body)
+            await response.read()
+            if response.status != 200:
+                raise RuntimeError(f"{route} returned {response.status}")
+
+        start = time.perf_counter()
+        await post("/prompt_db_search", {"query": "golden"})
+        result["search_first_query_ms"] = (time.perf_counter() - start) * 1000
+
+        routes = {
+            "/prompt_db_categories": lambda: {},
+            "/prompt_db_prompts": lambda: {"category": largest_category},
+            "/prompt_db_prompts (page of 100)": lambda: {"category": largest_category, "limit": 100},
+            "/prompt_db_text": lambda: dict(zip(("category", "prompt_name"), rng.choice(pairs))),
+            "/prompt_db_texts (10 prompts)": lambda: {"prompts": rng.sample(pairs, 10), "separator": ", "},
+            "/prompt_db_search": lambda: {"query": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"},
+            "/prompt_stack_preview": lambda: {"separator": ", ", "inputs": stack_inputs},
+        }
+        result["routes"] = {}
+        for label, make_body in routes.items():
+            route = label.split(" ")[0]
+            result["routes"][label] = await time_calls(lambda: post(route, make_body()), args.iterations)
+
+        # Many clients reading texts at once
+        async def reader(count):
+            for _ in range(count):
+                await post("/prompt_db_text", dict(zip(("category", "prompt_name"), rng.choice(pairs))))
+
+        per_client = max(args.requests // args.concurrency, 1)
+        start = time.perf_counter()
+        await asyncio.gather(*(reader(per_client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        result["concurrent_reads"] = {
+            "clients": args.concurrency,
+            "requests": per_client * args.concurrency,
+            "requests_per_s": per_client * args.concurrency / elapsed,
+        }
+
+        # Saves through the route, one at a time and as a concurrent burst
+        save_count = min(args.iterations, 50)
+        result["routes"]["/prompt_db_save"] = await time_calls(
+            lambda: post("/prompt_db_save", {"category": largest_category,
+                                             "prompt_name": f"bench save {rng.randrange(10)}",
+                                             "prompt_text": "saved"}),
+            save_count)
+        start = time.perf_counter()
+        await asyncio.gather(*(post("/prompt_db_save", {"category": largest_category,
+                                                         "prompt_name": f"bench burst {i}",
+                                                         "prompt_text": "saved"})
+                               for i in range(args.concurrency * 4)))
+        elapsed = time.perf_counter() - start
+        result["concurrent_saves"] = {
+            "clients": args.concurrency * 4,
+            "saves_per_s": args.concurrency * 4 / elapsed,
+        }
+    finally:
+        await client.close()
+
+    # Bytes written per save, measured around the store alone so HTTP traffic is excluded
+    written_before = bytes_written()
+    for i in range(save_count):
+        store.set_prompt(largest_category, f"bench save {i % 10}", f"saved {i}")
+        store.flush()
+    written_after = bytes_written()
+    result["bytes_written_per_save"] = (
+        (written_after - written_before) / save_count if written_before is not None else None)
+
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    result["store_stats"] = store.stats()
+    shutil.rmtree(base_path, ignore_errors=True)
+    return result
+
+
+def run_child(size, args):
+    """Run one size in a fresh interpreter and return its results"""
+    command = [sys.executable, os.path.abspath(__file__), "--single-size", str(size),
+               "--iterations", str(args.iterations), "--concurrency", str(args.concurrency),
+               "--requests", str(args.requests), "--seed", str(args.seed)]
+    env = dict(os.environ, PROMPT_DB_BACKEND=args.backend)
+    completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout)
+
+
+def print_summary(results):
+    """Short human-readable table on stderr; the JSON goes to stdout or --output"""
+    for result in results:
+        routes = result["routes"]
+        print(f"{result['size']:>8} prompts  {result['file_bytes'] / 1e6:8.1f} MB  "
+              f"load {result['cold_load_ms']:8.1f} ms  "
+              f"INPUT_TYPES p50 {result['input_types']['p50_ms']:7.3f} ms  "
+              f"text p50 {routes['/prompt_db_text']['p50_ms']:6.2f} ms  "
+              f"save p50 {routes['/prompt_db_save']['p50_ms']:7.2f} ms  "
+              f"{result['concurrent_reads']['requests_per_s']:7.0f} reads/s  "
+              f"RSS {result['peak_rss_bytes'] / 2 ** 20:7.1f} MiB", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,500000",
+                        help="comma-separated library sizes (number of prompts)")
+    parser.add_argument("--backend", default=os.environ.get("PROMPT_DB_BACKEND", "json"),
+                        help="storage backend to benchmark (json, wal or sqlite)")
+    parser.add_argument("--iterations", type=int, default=200, help="samples per latency measurement")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="total requests for the throughput run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--single-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single_size is not None:
+        json.dump(asyncio.run(run_size(args.single_size, args)), sys.stdout)
+        return
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+        print(f"Benchmarking {size} prompts ({args.backend})...", file=sys.stderr)
+        results.append(run_child(size, args))
+
+    report = {
+        "meta": {
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    print_summary(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""Stand-in for ComfyUI's folder_paths module, used by the benchmarks.
+
+The benchmark points base_path at a scratch directory before importing the
+package, so the user database lands in <base_path>/user/default/user-db.
+"""
+import tempfile
+
+base_path = tempfile.gettempdir()
+
+
+def get_folder_paths(folder_name):
+    return []
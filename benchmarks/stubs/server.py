@@ -0,0 +1,19 @@
+"""Stand-in for ComfyUI's server module, used by the benchmarks.
+
+Only what the package touches at import time is provided: a PromptServer
+instance whose route table the benchmark mounts on its own aiohttp app.
+"""
+from aiohttp import web
+
+
+class PromptServer:
+    instance = None
+
+    def __init__(self):
+        self.routes = web.RouteTableDef()
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+
+PromptServer.instance = PromptServer()
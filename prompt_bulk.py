@@ -0,0 +1,311 @@
+import io
+import csv
+import itertools
+from aiohttp import web
+import server
+from .prompt_db import get_prompt_store
+from .prompt_store import IMPORT_STRATEGIES, run_blocking
+from .prompt_history import get_history
+from .prompt_metrics import timed_route
+from . import prompt_codec
+
+# Request body is read in chunks of this size while importing
+IMPORT_CHUNK_BYTES = 256 * 1024
+
+# Lines parsed per thread pool call while importing
+IMPORT_BATCH_LINES = 5000
+
+# Prompts serialized per thread pool call while exporting
+EXPORT_BATCH_PROMPTS = 5000
+
+# Parse errors reported back in full; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_FIELDS = ("category", "prompt_name", "prompt_text")
+
+
+def request_format(request):
+    """The payload format from ?format=, else from the Content-Type, default json"""
+    fmt = request.query.get("format")
+    if fmt:
+        return fmt.lower()
+    for name, content_type in FORMATS.items():
+        if request.content_type == content_type:
+            return name
+    return "json"
+
+
+def make_record(category, prompt_name, prompt_text):
+    """Validate one imported prompt, returning (record, error)"""
+    if not isinstance(category, str) or not category:
+        return None, "category must be a non-empty string"
+    if not isinstance(prompt_name, str) or not prompt_name:
+        return None, "prompt_name must be a non-empty string"
+    if prompt_text is None:
+        prompt_text = ""
+    if not isinstance(prompt_text, str):
+        return None, "prompt_text must be a string"
+    return (category, prompt_name, prompt_text), None
+
+
+def parse_json_library(payload, records, errors):
+    """Parse a prompts.json-style {category: {prompt_name: prompt_text}} document"""
+    try:
+        prompts_db = prompt_codec.loads(payload)
+    except ValueError as e:
+        errors.append(f"invalid JSON: {e}")
+        return
+    if not isinstance(prompts_db, dict):
+        errors.append("expected a JSON object of categories")
+        return
+    for category, category_prompts in prompts_db.items():
+        if not isinstance(category_prompts, dict):
+            errors.append(f"category '{category}': expected an object of prompts")
+            continue
+        for prompt_name, prompt_text in category_prompts.items():
+            record, error = make_record(category, prompt_name, prompt_text)
+            if error:
+                errors.append(f"'{category}/{prompt_name}': {error}")
+            else:
+                records.append(record)
+
+
+def parse_ndjson_lines(lines, first_line, records, errors):
+    """Parse {"category", "prompt_name", "prompt_text"} objects, one per line"""
+    for line_number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            item = prompt_codec.loads(line)
+        except ValueError as e:
+            errors.append(f"line {line_number}: invalid JSON: {e}")
+            continue
+        if not isinstance(item, dict):
+            errors.append(f"line {line_number}: expected an object")
+            continue
+        record, error = make_record(item.get("category"), item.get("prompt_name"), item.get("prompt_text"))
+        if error:
+            errors.append(f"line {line_number}: {error}")
+        else:
+            records.append(record)
+
+
+def parse_csv_lines(lines, header, records, errors):
+    """Parse CSV rows with category, prompt_name and prompt_text columns.
+
+    header is a one-item list holding the column positions once the header row
+    has been read, so it carries over between batches.
+    """
+    text_lines = (line.decode('utf-8-sig' if header[0] is None else 'utf-8') for line in lines)
+    for row in csv.reader(text_lines):
+        if not row:
+            continue
+        if header[0] is None:
+            columns = [column.strip().lower() for column in row]
+            missing = [field for field in CSV_FIELDS[:2] if field not in columns]
+            if missing:
+                errors.append(f"CSV header is missing {', '.join(missing)}")
+                header[0] = False
+            else:
+                header[0] = {field: columns.index(field) for field in CSV_FIELDS if field in columns}
+            continue
+        if header[0] is False:
+            return
+        values = {field: row[index] if index < len(row) else "" for field, index in header[0].items()}
+        record, error = make_record(values["category"], values["prompt_name"], values.get("prompt_text", ""))
+        if error:
+            errors.append(f"row {', '.join(row)[:60]!r}: {error}")
+        else:
+            records.append(record)
+
+
+async def read_line_batches(content, csv_quotes=False):
+    """Yield lists of complete lines (bytes, with line endings) as the body arrives.
+
+    With csv_quotes a batch only ends where the number of quotes so far is even,
+    so a quoted CSV field spanning several lines is never split.
+    """
+    pending = b""
+    batch = []
+    quotes = 0
+    async for chunk in content.iter_chunked(IMPORT_CHUNK_BYTES):
+        buffer = pending + chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = buffer[start:end + 1]
+            start = end + 1
+            batch.append(line)
+            if csv_quotes:
+                quotes += line.count(b'"')
+            if len(batch) >= IMPORT_BATCH_LINES and quotes % 2 == 0:
+                yield batch
+                batch = []
+        pending = buffer[start:]
+    if pending:
+        batch.append(pending)
+    if batch:
+        yield batch
+
+
+def import_records(store, records, on_conflict):
+    """Import records into store and record the prompts they overwrote; returns the import counts.
+
+    The texts being replaced are read under the same store lock as the import,
+    and the history lock is held until their revisions are written.
+    """
+    history = get_history(store.prompts_file)
+    with history.locked():
+        with store.locked():
+            previous = store.get_texts([(category, prompt_name) for category, prompt_name, _ in records])
+            counts = store.import_prompts(records, on_conflict)
+        if on_conflict == "overwrite":
+            # Overwritten prompts get a revision, so an import can be undone prompt by prompt;
+            # new prompts don't, which keeps big imports from creating a file per prompt
+            changes = [(category, prompt_name, prompt_text, old_text)
+                       for (category, prompt_name, prompt_text), old_text in zip(records, previous)
+                       if old_text and old_text != prompt_text]
+            if changes:
+                history.record_many(changes)
+    return counts
+
+
+# API endpoint for importing many prompts at once from a JSON, NDJSON or CSV upload
+@server.PromptServer.instance.routes.post("/prompt_db_import")
+@timed_route
+async def import_prompts(request):
+    try:
+        fmt = request_format(request)
+        on_conflict = request.query.get("on_conflict", "overwrite")
+
+        if fmt not in FORMATS:
+            return web.json_response({"success": False, "message": f"Unknown format '{fmt}'"}, status=400)
+        if on_conflict not in IMPORT_STRATEGIES:
+            return web.json_response({"success": False, "message": f"Unknown on_conflict '{on_conflict}'"}, status=400)
+
+        # The body is streamed rather than read at once, so uploads aren't capped
+        # by the server's request size limit and parsing overlaps the upload
+        records = []
+        errors = []
+        if fmt == "json":
+            payload = bytearray()
+            async for chunk in request.content.iter_chunked(IMPORT_CHUNK_BYTES):
+                payload += chunk
+            await run_blocking(parse_json_library, bytes(payload), records, errors)
+            del payload
+        elif fmt == "ndjson":
+            line_number = 1
+            async for lines in read_line_batches(request.content):
+                await run_blocking(parse_ndjson_lines, lines, line_number, records, errors)
+                line_number += len(lines)
+        else:
+            header = [None]
+            async for lines in read_line_batches(request.content, csv_quotes=True):
+                await run_blocking(parse_csv_lines, lines, header, records, errors)
+
+        # All or nothing: a payload with errors changes nothing
+        if errors:
+            return web.json_response({
+                "success": False,
+                "message": f"{len(errors)} invalid entries, nothing was imported",
+                "errors": errors[:MAX_REPORTED_ERRORS],
+                "error_count": len(errors),
+            }, status=400)
+
+        store = await run_blocking(get_prompt_store)
+        counts = await run_blocking(import_records, store, records, on_conflict)
+        await store.commit()
+
+        return web.json_response({
+            "success": True,
+            "message": f"Imported {len(records)} prompts",
+            "received": len(records),
+            **counts,
+        })
+
+    except Exception as e:
+        print(f"Error in import_prompts: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+def export_batches(prompts_db, fmt):
+    """Yield the library as encoded chunks of about EXPORT_BATCH_PROMPTS prompts"""
+    if fmt == "json":
+        yield b"{"
+        for position, (category, category_prompts) in enumerate(prompts_db.items()):
+            separator = b"," if position else b""
+            yield separator + prompt_codec.dumps(category) + b":" + prompt_codec.dumps(category_prompts)
+        yield b"}"
+        return
+
+    rows = ((category, prompt_name, prompt_text)
+            for category, category_prompts in prompts_db.items()
+            for prompt_name, prompt_text in category_prompts.items())
+    batches = iter(lambda: list(itertools.islice(rows, EXPORT_BATCH_PROMPTS)), [])
+
+    if fmt == "ndjson":
+        for batch in batches:
+            yield b"".join(
+                prompt_codec.dumps({"category": category, "prompt_name": prompt_name, "prompt_text": prompt_text}) + b"\n"
+                for category, prompt_name, prompt_text in batch)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# API endpoint for exporting the library (or some categories) as JSON, NDJSON or CSV
+@server.PromptServer.instance.routes.get("/prompt_db_export")
+@timed_route
+async def export_prompts(request):
+    fmt = request_format(request)
+    if fmt not in FORMATS:
+        return web.json_response({"success": False, "message": f"Unknown format '{fmt}'"}, status=400)
+
+    try:
+        store = await run_blocking(get_prompt_store)
+        prompts_db = await run_blocking(store.snapshot)
+
+        # ?category= may be given several times to export only those categories
+        categories = request.query.getall("category", [])
+        prompts_db = {
+            category: category_prompts for category, category_prompts in prompts_db.items()
+            if isinstance(category_prompts, dict) and (not categories or category in categories)
+        }
+    except Exception as e:
+        print(f"Error in export_prompts: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": f"{FORMATS[fmt]}; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="prompts.{fmt}"',
+    })
+    await response.prepare(request)
+    batches = export_batches(prompts_db, fmt)
+    try:
+        while True:
+            payload = await run_blocking(next, batches, None)
+            if payload is None:
+                break
+            await response.write(payload)
+    except Exception as e:
+        # Headers are already sent, so all we can do is end the stream early
+        print(f"Error streaming export: {e}")
+    await response.write_eof()
+    return response
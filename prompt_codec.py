@@ -0,0 +1,102 @@
+import os
+import json
+
+# Optional fast JSON libraries, used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class JsonCodec:
+    """Standard library json, always available"""
+
+    name = "json"
+
+    def loads(self, payload):
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode('utf-8')
+        return json.loads(payload)
+
+    def dumps(self, value, pretty=False):
+        if pretty:
+            return json.dumps(value, indent=2, ensure_ascii=False).encode('utf-8')
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+class OrjsonCodec:
+    """orjson: parses and serializes several times faster than json"""
+
+    name = "orjson"
+
+    def loads(self, payload):
+        return orjson.loads(payload)
+
+    def dumps(self, value, pretty=False):
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+
+class MsgspecCodec:
+    """msgspec: comparable to orjson"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def loads(self, payload):
+        return self._decoder.decode(payload)
+
+    def dumps(self, value, pretty=False):
+        encoded = self._encoder.encode(value)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+
+
+CODECS = {
+    "orjson": OrjsonCodec if orjson is not None else None,
+    "msgspec": MsgspecCodec if msgspec is not None else None,
+    "json": JsonCodec,
+}
+
+
+def available_codecs():
+    """Names of the codecs that can be used in this environment, fastest first"""
+    return [name for name, codec_class in CODECS.items() if codec_class is not None]
+
+
+def get_codec(name=None):
+    """Return a codec by name, or the fastest available one for "auto".
+
+    The default comes from the PROMPT_DB_CODEC environment variable (auto,
+    orjson, msgspec or json). A codec that isn't installed falls back to auto.
+    """
+    name = (name or os.environ.get("PROMPT_DB_CODEC", "auto")).strip().lower()
+    if name != "auto":
+        if CODECS.get(name) is not None:
+            return CODECS[name]()
+        print(f"PROMPT_DB_CODEC '{name}' is not available, using the fastest installed codec")
+    return CODECS[available_codecs()[0]]()
+
+
+CODEC = get_codec()
+
+
+def loads(payload):
+    """Parse JSON from bytes or str"""
+    return CODEC.loads(payload)
+
+
+def dumps(value, pretty=False):
+    """Serialize to UTF-8 JSON bytes (non-ASCII kept as is), indented by two spaces if pretty"""
+    return CODEC.dumps(value, pretty)
+
+
+def dumps_text(value):
+    """Compact JSON as str, for aiohttp's json_response(dumps=...)"""
+    return CODEC.dumps(value).decode('utf-8')
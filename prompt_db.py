@@ -1,27 +1,16 @@
 import os
-import json
+import hashlib
+import itertools
 import folder_paths
 from aiohttp import web
 import server
-
-# DRY: Define default prompts once at module level
-DEFAULT_PROMPTS = {
-    "poses": {
-        "posing with camera": "a person posing with a camera, professional photography pose, confident stance",
-        "casual sitting": "person sitting casually, relaxed posture, natural lighting",
-        "standing portrait": "person standing in portrait pose, direct eye contact, professional setting"
-    },
-    "styles": {
-        "cinematic": "cinematic lighting, dramatic shadows, film grain, professional cinematography",
-        "artistic": "artistic composition, creative lighting, expressive style, fine art photography",
-        "minimalist": "clean composition, minimal background, simple elegant style"
-    },
-    "quality": {
-        "high quality": "masterpiece, best quality, ultra detailed, 8k resolution, professional photography",
-        "artistic quality": "artistic masterpiece, fine art, museum quality, exceptional detail",
-        "photorealistic": "photorealistic, hyperrealistic, lifelike, professional photo quality"
-    }
-}
+from .prompt_store import DEFAULT_PROMPTS, get_store, run_blocking
+from .prompt_search import get_search_index
+from .prompt_template import TemplateError, get_template_engine, read_variables
+from .prompt_history import get_history
+from .prompt_dedup import DEFAULT_THRESHOLD, find_duplicates, merge_prompts
+from .prompt_metrics import METRICS, timed_route
+from . import prompt_codec
 
 def get_comfy_path():
     """Get the ComfyUI root directory with fallback methods"""
@@ -70,6 +59,13 @@ def get_user_db_path():
         return get_comfy_path()  # fallback to root
 
 
+def get_prompt_store():
+    """Get the shared prompt store for the user database"""
+    store = get_store(os.path.join(get_user_db_path(), "prompts.json"))
+    store.ensure_file()
+    return store
+
+
 class PromptDB:
     def __init__(self):
         # Get the user database directory
@@ -79,59 +75,40 @@ class PromptDB:
     
     def ensure_prompts_file(self):
         """Create prompts.json file if it doesn't exist"""
-        if not os.path.exists(self.prompts_file):
-            try:
-                os.makedirs(os.path.dirname(self.prompts_file), exist_ok=True)
-                with open(self.prompts_file, 'w', encoding='utf-8') as f:
-                    json.dump(DEFAULT_PROMPTS, f, indent=2, ensure_ascii=False)
-            except Exception as e:
-                print(f"Error creating prompts.json: {e}")
+        get_store(self.prompts_file).ensure_file()
+
+    @staticmethod
+    def build_options(store):
+        """Build the category and prompt name option lists for INPUT_TYPES"""
+        categories = store.categories()
+        
+        # Collect all possible prompt names from all categories, in a consistent order
+        prompt_names = sorted(store.all_prompt_names())
+        default_prompt = ""
+        
+        # Use the first category's first prompt as default
+        if categories and prompt_names:
+            first_category_prompts = store.prompt_names(categories[0])
+            if first_category_prompts:
+                # Put the first prompt from the first category at the beginning
+                default_prompt = first_category_prompts[0]
+                prompt_names.remove(default_prompt)
+                prompt_names.insert(0, default_prompt)
+        
+        return categories, prompt_names, default_prompt
 
     @classmethod
     def INPUT_TYPES(cls):
-        # Load categories from the prompts file
+        # Load categories from the prompt store
         categories = []
         prompt_names = []
+        default_prompt = ""
         
         try:
-            # Get the user database directory
-            user_db_path = get_user_db_path()
-            prompts_file = os.path.join(user_db_path, "prompts.json")
-            
-            # Create file if it doesn't exist
-            if not os.path.exists(prompts_file):
-                try:
-                    os.makedirs(os.path.dirname(prompts_file), exist_ok=True)
-                    with open(prompts_file, 'w', encoding='utf-8') as f:
-                        json.dump(DEFAULT_PROMPTS, f, indent=2, ensure_ascii=False)
-                except Exception as e:
-                    print(f"Error creating prompts.json: {e}")
-            
-            # Load the prompts file
-            if os.path.exists(prompts_file):
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-                    categories = list(prompts_db.keys())
-                    
-                    # Collect all possible prompt names from all categories
-                    all_prompt_names = set()
-                    for category_prompts in prompts_db.values():
-                        if isinstance(category_prompts, dict):
-                            all_prompt_names.update(category_prompts.keys())
-                    
-                    # Convert to list and ensure consistent ordering
-                    prompt_names = sorted(list(all_prompt_names))
-                    
-                    # Use the first category's first prompt as default
-                    if categories and prompt_names:
-                        first_category = categories[0]
-                        first_category_prompts = list(prompts_db[first_category].keys())
-                        if first_category_prompts:
-                            # Put the first prompt from the first category at the beginning
-                            default_prompt = first_category_prompts[0]
-                            if default_prompt in prompt_names:
-                                prompt_names.remove(default_prompt)
-                                prompt_names.insert(0, default_prompt)
+            # The lists are only rebuilt when the library changed since the last call
+            store = get_prompt_store()
+            categories, prompt_names, default_prompt = store.memoize(
+                "PromptDB.options", lambda: cls.build_options(store))
                         
         except Exception as e:
             print(f"Error loading categories for INPUT_TYPES: {e}")
@@ -141,21 +118,6 @@ class PromptDB:
             categories = ["default"]
             prompt_names = ["new prompt"]
         
-        # Ensure the default prompt is from the first category
-        default_prompt = ""
-        if categories and len(categories) > 0:
-            try:
-                # Re-read the file to get the first category's first prompt
-                if os.path.exists(prompts_file):
-                    with open(prompts_file, 'r', encoding='utf-8') as f:
-                        prompts_db = json.load(f)
-                        first_category = categories[0]
-                        first_category_prompts = list(prompts_db.get(first_category, {}).keys())
-                        if first_category_prompts:
-                            default_prompt = first_category_prompts[0]
-            except Exception as e:
-                pass
-        
         if not default_prompt and prompt_names:
             default_prompt = prompt_names[0]
         
@@ -172,64 +134,142 @@ class PromptDB:
     FUNCTION = "get_prompt"
     CATEGORY = "text"
     
+    @classmethod
+    def IS_CHANGED(cls, category="", prompt_name="", prompt_text=""):
+        """Hash the output text; the node returns its text widget, not the stored prompt"""
+        return hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()
+    
     def get_prompt(self, category="", prompt_name="", prompt_text=""):
         """Return the prompt text"""
         return (prompt_text,)
 
 
+# Lines written per chunk when streaming NDJSON
+STREAM_CHUNK_LINES = 256
+
+
+async def listing_response(request, data, items, list_key, item_key, headers=None):
+    """Answer a listing request from a lazy iterator of (cursor, name) pairs.
+
+    Without a limit the whole listing is returned, as before. With a limit the
+    response holds one page plus a next_cursor (null on the last page), and
+    "format": "ndjson" streams one {item_key, "cursor"} object per line instead.
+    offset skips that many matches after the cursor. headers are added to JSON
+    responses. The iterator is advanced on the store thread pool.
+    """
+    offset = max(int(data.get("offset", 0)), 0)
+    limit = data.get("limit")
+    limit = max(int(limit), 1) if limit is not None else None
+    
+    if data.get("format") == "ndjson":
+        items = itertools.islice(items, offset, None if limit is None else offset + limit)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+        await response.prepare(request)
+        try:
+            while True:
+                chunk = await run_blocking(list, itertools.islice(items, STREAM_CHUNK_LINES))
+                if not chunk:
+                    break
+                await response.write(b"".join(
+                    prompt_codec.dumps({item_key: name, "cursor": cursor}) + b"\n"
+                    for cursor, name in chunk
+                ))
+        except Exception as e:
+            # Headers are already sent, so all we can do is end the stream early
+            print(f"Error streaming {list_key}: {e}")
+        await response.write_eof()
+        return response
+    
+    # One extra item tells whether there is another page
+    items = itertools.islice(items, offset, None if limit is None else offset + limit + 1)
+    page = await run_blocking(list, items)
+    if limit is None:
+        return web.json_response(
+            {list_key: [name for _, name in page]}, headers=headers, dumps=prompt_codec.dumps_text)
+    
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+    return web.json_response(
+        {list_key: [name for _, name in page[:limit]], "next_cursor": next_cursor},
+        headers=headers, dumps=prompt_codec.dumps_text)
+
+
+async def library_etag(store):
+    """Quoted ETag for the current library version"""
+    return f'"{await run_blocking(store.version_tag)}"'
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the client already has this version, else None"""
+    if etag in request.headers.get("If-None-Match", ""):
+        return web.Response(status=304, headers={"ETag": etag})
+    return None
+
+
+async def read_listing_request(request):
+    """Return the JSON body of a listing request, tolerating an empty body"""
+    data = await request.json() if request.can_read_body else {}
+    return data if isinstance(data, dict) else {}
+
+
 # API endpoint for loading categories
 @server.PromptServer.instance.routes.post("/prompt_db_categories")
+@timed_route
 async def load_categories(request):
     try:
-        # Get the user database directory
-        user_db_path = get_user_db_path()
-        prompts_file = os.path.join(user_db_path, "prompts.json")
+        data = await read_listing_request(request)
+        prefix = data.get("prefix") or ""
         
-        # Load prompts database
-        prompts_db = {}
-        if os.path.exists(prompts_file):
-            try:
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading prompts.json: {e}")
+        store = await run_blocking(get_prompt_store)
+        etag = await library_etag(store)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
         
-        categories = list(prompts_db.keys()) if prompts_db else []
+        items = await run_blocking(store.iter_categories, prefix=prefix, cursor=data.get("cursor"))
         
-        return web.json_response({"categories": categories})
+        return await listing_response(request, data, items, "categories", "category", {"ETag": etag})
         
     except Exception as e:
         print(f"Error in load_categories: {e}")
         return web.json_response({"categories": []}, status=500)
 
 
+# API endpoint for the library version, to tell whether cached lists are still current
+@server.PromptServer.instance.routes.get("/prompt_db_version")
+@timed_route
+async def load_version(request):
+    try:
+        store = await run_blocking(get_prompt_store)
+        version = await run_blocking(store.version_tag)
+        
+        return web.json_response({"version": version}, headers={"ETag": f'"{version}"'})
+        
+    except Exception as e:
+        print(f"Error in load_version: {e}")
+        return web.json_response({"version": None}, status=500)
+
+
 # API endpoint for loading prompts in a category
 @server.PromptServer.instance.routes.post("/prompt_db_prompts")
+@timed_route
 async def load_prompts(request):
     try:
-        data = await request.json()
+        data = await read_listing_request(request)
         category = data.get("category", "")
+        prefix = data.get("prefix") or ""
         
         if not category:
             return web.json_response({"prompts": []})
         
-        # Get the user database directory
-        user_db_path = get_user_db_path()
-        prompts_file = os.path.join(user_db_path, "prompts.json")
-        
-        # Load prompts database
-        prompts_db = {}
-        if os.path.exists(prompts_file):
-            try:
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading prompts.json: {e}")
+        store = await run_blocking(get_prompt_store)
+        etag = await library_etag(store)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
         
-        category_prompts = prompts_db.get(category, {})
-        prompt_names = list(category_prompts.keys()) if category_prompts else []
+        items = await run_blocking(store.iter_prompt_names, category, prefix=prefix, cursor=data.get("cursor"))
         
-        return web.json_response({"prompts": prompt_names})
+        return await listing_response(request, data, items, "prompts", "prompt_name", {"ETag": etag})
         
     except Exception as e:
         print(f"Error in load_prompts: {e}")
@@ -238,6 +278,7 @@ async def load_prompts(request):
 
 # API endpoint for loading prompt text
 @server.PromptServer.instance.routes.post("/prompt_db_text")
+@timed_route
 async def load_prompt_text(request):
     try:
         data = await request.json()
@@ -247,20 +288,8 @@ async def load_prompt_text(request):
         if not category or not prompt_name:
             return web.json_response({"prompt_text": ""})
         
-        # Get the user database directory
-        user_db_path = get_user_db_path()
-        prompts_file = os.path.join(user_db_path, "prompts.json")
-        
-        # Load prompts database
-        prompts_db = {}
-        if os.path.exists(prompts_file):
-            try:
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading prompts.json: {e}")
-        
-        prompt_text = prompts_db.get(category, {}).get(prompt_name, "")
+        store = await run_blocking(get_prompt_store)
+        prompt_text = await run_blocking(store.get_text, category, prompt_name)
         
         return web.json_response({"prompt_text": prompt_text})
         
@@ -269,8 +298,75 @@ async def load_prompt_text(request):
         return web.json_response({"prompt_text": ""}, status=500)
 
 
+# API endpoint for loading many prompt texts in one request
+@server.PromptServer.instance.routes.post("/prompt_db_texts")
+@timed_route
+async def load_prompt_texts(request):
+    try:
+        data = await request.json()
+        entries = data.get("prompts", [])
+        
+        # Accept either {"category", "prompt_name"} objects or [category, prompt_name] pairs
+        pairs = []
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict):
+                pairs.append((entry.get("category", ""), entry.get("prompt_name", "")))
+            elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+                pairs.append((entry[0], entry[1]))
+            else:
+                pairs.append(("", ""))
+        
+        store = await run_blocking(get_prompt_store)
+        response = {"prompt_texts": await run_blocking(store.get_texts, pairs)}
+        
+        # Optionally join the texts exactly as PromptStack does, includes and
+        # variables ({"name": value} or "name = value" lines) expanded
+        separator = data.get("separator")
+        if isinstance(separator, str):
+            variables = read_variables(data.get("variables", ""))
+            engine = get_template_engine(store)
+            try:
+                response["stacked_prompts"] = await run_blocking(engine.render_stack, pairs, separator, variables)
+            except TemplateError as e:
+                response["stacked_prompts"] = ""
+                response["error"] = str(e)
+        
+        return web.json_response(response)
+        
+    except Exception as e:
+        print(f"Error in load_prompt_texts: {e}")
+        return web.json_response({"prompt_texts": []}, status=500)
+
+
+# API endpoint for searching prompt names and texts
+@server.PromptServer.instance.routes.post("/prompt_db_search")
+@timed_route
+async def search_prompts(request):
+    try:
+        data = await request.json()
+        query = data.get("query", "")
+        category = data.get("category") or None
+        offset = max(int(data.get("offset", 0)), 0)
+        limit = min(max(int(data.get("limit", 50)), 1), 500)
+        fuzzy = bool(data.get("fuzzy", True))
+        
+        if not isinstance(query, str) or not query.strip():
+            return web.json_response({"results": [], "total": 0, "offset": offset, "limit": limit})
+        
+        index = get_search_index(await run_blocking(get_prompt_store))
+        results, total = await run_blocking(
+            index.search, query, category=category, offset=offset, limit=limit, fuzzy=fuzzy)
+        
+        return web.json_response({"results": results, "total": total, "offset": offset, "limit": limit})
+        
+    except Exception as e:
+        print(f"Error in search_prompts: {e}")
+        return web.json_response({"results": [], "total": 0}, status=500)
+
+
 # API endpoint for saving prompt text
 @server.PromptServer.instance.routes.post("/prompt_db_save")
+@timed_route
 async def save_prompt_text(request):
     try:
         data = await request.json()
@@ -281,31 +377,11 @@ async def save_prompt_text(request):
         if not category or not prompt_name:
             return web.json_response({"success": False, "message": "Category and prompt name are required"})
         
-        # Get the user database directory
-        user_db_path = get_user_db_path()
-        prompts_file = os.path.join(user_db_path, "prompts.json")
-        
-        # Load existing prompts database
-        prompts_db = {}
-        if os.path.exists(prompts_file):
-            try:
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading prompts.json: {e}")
-        
-        # Ensure category exists
-        if category not in prompts_db:
-            prompts_db[category] = {}
-        
-        # Save the prompt text
-        prompts_db[category][prompt_name] = prompt_text
-        
-        # Save to file
+        # Save the prompt text (creates the category if needed)
         try:
-            os.makedirs(os.path.dirname(prompts_file), exist_ok=True)
-            with open(prompts_file, 'w', encoding='utf-8') as f:
-                json.dump(prompts_db, f, indent=2, ensure_ascii=False)
+            store = await run_blocking(get_prompt_store)
+            await run_blocking(get_history(store.prompts_file).replace, store, category, prompt_name, prompt_text)
+            await store.commit()
             
             return web.json_response({"success": True, "message": f"Saved prompt '{prompt_name}'"})
             
@@ -320,6 +396,7 @@ async def save_prompt_text(request):
 
 # API endpoint for creating new category/prompt
 @server.PromptServer.instance.routes.post("/prompt_db_create")
+@timed_route
 async def create_new_prompt(request):
     try:
         data = await request.json()
@@ -329,32 +406,13 @@ async def create_new_prompt(request):
         if not category or not prompt_name:
             return web.json_response({"success": False, "message": "Category and prompt name are required"})
         
-        # Get the user database directory
-        user_db_path = get_user_db_path()
-        prompts_file = os.path.join(user_db_path, "prompts.json")
-        
-        # Load existing prompts database
-        prompts_db = {}
-        if os.path.exists(prompts_file):
-            try:
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading prompts.json: {e}")
-        
-        # Ensure category exists (create if new, use existing if already exists)
-        is_new_category = category not in prompts_db
-        if category not in prompts_db:
-            prompts_db[category] = {}
-        
-        # Create new prompt with empty text
-        prompts_db[category][prompt_name] = ""
-        
-        # Save to file
+        # Create new prompt with empty text (and the category if it is new)
         try:
-            os.makedirs(os.path.dirname(prompts_file), exist_ok=True)
-            with open(prompts_file, 'w', encoding='utf-8') as f:
-                json.dump(prompts_db, f, indent=2, ensure_ascii=False)
+            store = await run_blocking(get_prompt_store)
+            # Creating over an existing prompt blanks it; the history keeps the old text restorable
+            _, is_new_category = await run_blocking(
+                get_history(store.prompts_file).replace, store, category, prompt_name, "")
+            await store.commit()
             
             if is_new_category:
                 message = f"Created new category '{category}' and added prompt '{prompt_name}'"
@@ -370,3 +428,207 @@ async def create_new_prompt(request):
     except Exception as e:
         print(f"Error in create_new_prompt: {e}")
         return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+async def read_history_request(request, require_rev=False):
+    """Read {category, prompt_name, rev?} from a history request, returning (data, error response)"""
+    data = await request.json()
+    if not data.get("category") or not data.get("prompt_name"):
+        return data, web.json_response({"success": False, "message": "Category and prompt name are required"},
+                                       status=400)
+    if require_rev and "rev" not in data:
+        return data, web.json_response({"success": False, "message": "rev is required"}, status=400)
+    if "rev" in data and not isinstance(data["rev"], int):
+        return data, web.json_response({"success": False, "message": "rev must be an integer"}, status=400)
+    return data, None
+
+
+# API endpoint for listing a prompt's saved revisions, newest first
+@server.PromptServer.instance.routes.post("/prompt_db_history")
+@timed_route
+async def load_history(request):
+    try:
+        data, error = await read_history_request(request)
+        if error is not None:
+            return error
+        
+        store = await run_blocking(get_prompt_store)
+        revisions = await run_blocking(get_history(store.prompts_file).revisions, data["category"], data["prompt_name"])
+        
+        return web.json_response({"success": True, "revisions": revisions})
+        
+    except Exception as e:
+        print(f"Error in load_history: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for the text of one revision of a prompt
+@server.PromptServer.instance.routes.post("/prompt_db_history_revision")
+@timed_route
+async def load_revision(request):
+    try:
+        data, error = await read_history_request(request, require_rev=True)
+        if error is not None:
+            return error
+        
+        store = await run_blocking(get_prompt_store)
+        history = get_history(store.prompts_file)
+        record, prompt_text = await run_blocking(history.revision, data["category"], data["prompt_name"], data["rev"])
+        if record is None:
+            return web.json_response({"success": False, "message": f"No revision {data['rev']}"}, status=404)
+        
+        return web.json_response({"success": True, "rev": record["rev"], "time": record["time"],
+                                  "prompt_text": prompt_text})
+        
+    except Exception as e:
+        print(f"Error in load_revision: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for restoring a prompt to an earlier revision (recorded as a new revision)
+@server.PromptServer.instance.routes.post("/prompt_db_history_restore")
+@timed_route
+async def restore_revision(request):
+    try:
+        data, error = await read_history_request(request, require_rev=True)
+        if error is not None:
+            return error
+        category = data["category"]
+        prompt_name = data["prompt_name"]
+        
+        store = await run_blocking(get_prompt_store)
+        history = get_history(store.prompts_file)
+        record, prompt_text = await run_blocking(history.revision, category, prompt_name, data["rev"])
+        if record is None:
+            return web.json_response({"success": False, "message": f"No revision {data['rev']}"}, status=404)
+        
+        await run_blocking(history.replace, store, category, prompt_name, prompt_text, record["rev"])
+        await store.commit()
+        
+        return web.json_response({"success": True, "message": f"Restored revision {record['rev']} of '{prompt_name}'",
+                                  "prompt_text": prompt_text})
+        
+    except Exception as e:
+        print(f"Error in restore_revision: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for deleting a prompt (its text stays restorable from history)
+@server.PromptServer.instance.routes.post("/prompt_db_delete")
+@timed_route
+async def delete_prompt(request):
+    try:
+        data, error = await read_history_request(request)
+        if error is not None:
+            return error
+        category = data["category"]
+        prompt_name = data["prompt_name"]
+        
+        store = await run_blocking(get_prompt_store)
+        try:
+            previous = await run_blocking(get_history(store.prompts_file).delete, store, category, prompt_name)
+        except ValueError as e:
+            return web.json_response({"success": False, "message": str(e)}, status=400)
+        if previous is None:
+            return web.json_response({"success": False, "message": f"No prompt '{prompt_name}' in '{category}'"},
+                                     status=404)
+        await store.commit()
+        
+        return web.json_response({"success": True, "message": f"Deleted prompt '{prompt_name}'"})
+
+    except Exception as e:
+        print(f"Error in delete_prompt: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for finding clusters of near-duplicate prompts
+@server.PromptServer.instance.routes.post("/prompt_db_duplicates")
+@timed_route
+async def load_duplicates(request):
+    try:
+        data = await request.json()
+        threshold = data.get("threshold", DEFAULT_THRESHOLD)
+        categories = data.get("categories") or []
+        
+        if not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+            return web.json_response({"success": False, "message": "threshold must be between 0 and 1"}, status=400)
+        if not isinstance(categories, list):
+            return web.json_response({"success": False, "message": "categories must be a list"}, status=400)
+        
+        store = await run_blocking(get_prompt_store)
+        key = ("duplicates", float(threshold), tuple(sorted(set(categories))))
+        clusters = await run_blocking(
+            store.memoize, key, lambda: find_duplicates(store.snapshot(), threshold, set(categories)))
+        
+        return web.json_response({"success": True, "clusters": clusters,
+                                  "duplicates": sum(len(cluster) - 1 for cluster in clusters)})
+
+    except Exception as e:
+        print(f"Error in load_duplicates: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for merging duplicates into one prompt: the kept prompt is saved
+# with prompt_text (if given) and the others are deleted, all recorded in history
+@server.PromptServer.instance.routes.post("/prompt_db_merge")
+@timed_route
+async def merge_duplicates(request):
+    try:
+        data = await request.json()
+        keep = data.get("keep") or {}
+        remove = data.get("remove") or []
+        prompt_text = data.get("prompt_text")
+        
+        if not isinstance(keep, dict) or not keep.get("category") or not keep.get("prompt_name"):
+            return web.json_response({"success": False, "message": "keep needs a category and prompt name"},
+                                     status=400)
+        if not isinstance(remove, list) or not all(
+                isinstance(item, dict) and item.get("category") and item.get("prompt_name") for item in remove):
+            return web.json_response({"success": False, "message": "remove must list categories and prompt names"},
+                                     status=400)
+        if prompt_text is not None and not isinstance(prompt_text, str):
+            return web.json_response({"success": False, "message": "prompt_text must be a string"}, status=400)
+        
+        store = await run_blocking(get_prompt_store)
+        try:
+            changes = await run_blocking(
+                merge_prompts, store, get_history(store.prompts_file), (keep["category"], keep["prompt_name"]),
+                [(item["category"], item["prompt_name"]) for item in remove], prompt_text)
+        except ValueError as e:
+            return web.json_response({"success": False, "message": str(e)}, status=400)
+        await store.commit()
+        
+        deleted = sum(1 for change in changes if change[:2] != (keep["category"], keep["prompt_name"]))
+        return web.json_response({"success": True, "message": f"Merged {deleted} prompts into '{keep['prompt_name']}'",
+                                  "deleted": deleted})
+
+    except Exception as e:
+        print(f"Error in merge_duplicates: {e}")
+        return web.json_response({"success": False, "message": f"Error: {e}"}, status=500)
+
+
+# API endpoint for performance metrics; ?format=prometheus for the Prometheus text format
+@server.PromptServer.instance.routes.get("/prompt_db_metrics")
+async def load_metrics(request):
+    try:
+        store = await run_blocking(get_prompt_store)
+        store_stats = await run_blocking(store.stats)
+        search_stats = await run_blocking(get_search_index(store).stats)
+        template_stats = await run_blocking(get_template_engine(store).stats)
+        
+        if request.query.get("format") == "prometheus":
+            gauges = {f"store_{key}": value for key, value in store_stats.items()}
+            gauges.update({f"search_{key}": value for key, value in search_stats.items()})
+            gauges.update({f"template_{key}": value for key, value in template_stats.items()})
+            return web.Response(text=METRICS.prometheus(gauges), content_type="text/plain",
+                                headers={"X-Content-Type-Options": "nosniff"})
+        
+        metrics = METRICS.snapshot()
+        metrics["store"] = store_stats
+        metrics["search"] = search_stats
+        metrics["templates"] = template_stats
+        return web.json_response(metrics)
+        
+    except Exception as e:
+        print(f"Error in load_metrics: {e}")
+        return web.json_response({}, status=500)
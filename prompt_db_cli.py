@@ -0,0 +1,121 @@
+"""Command-line maintenance tasks for the prompt library.
+
+Run from the package directory, pointing at a prompts.json file, e.g.
+
+    python prompt_db_cli.py sqlite-import ComfyUI/user/default/user-db/prompts.json
+
+This works without a running ComfyUI: only the storage modules are imported.
+"""
+import os
+import sys
+import types
+import argparse
+import importlib
+
+PACKAGE_NAME = "comfy_prompt_db"
+
+
+def load_module(name):
+    """Import one of this package's modules without running __init__ (which needs ComfyUI)"""
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+def sqlite_import(args):
+    """Load prompts.json into prompts.sqlite3 next to it"""
+    SqlitePromptStore = load_module("prompt_sqlite").SqlitePromptStore
+    store = SqlitePromptStore(os.path.abspath(args.prompts_file))
+    store.import_json(args.source or store.prompts_file)
+    print(f"Imported into {store.db_file}: {store.stats()['categories']} categories")
+
+
+def sqlite_export(args):
+    """Write prompts.sqlite3 back out in the prompts.json layout"""
+    SqlitePromptStore = load_module("prompt_sqlite").SqlitePromptStore
+    store = SqlitePromptStore(os.path.abspath(args.prompts_file))
+    store.export_json(args.output)
+    print(f"Exported {store.db_file} to {args.output or store.prompts_file}")
+
+
+def export(args):
+    """Write the library as indented JSON for reading or hand-editing"""
+    prompt_store = load_module("prompt_store")
+    prompt_codec = load_module("prompt_codec")
+    store = prompt_store.get_store(args.prompts_file)
+    payload = prompt_codec.dumps(store.snapshot(), pretty=True)
+    if args.output:
+        prompt_store.write_atomic(os.path.abspath(args.output), payload)
+    else:
+        sys.stdout.buffer.write(payload + b"\n")
+
+
+def duplicates(args):
+    """Report clusters of near-duplicate prompts, optionally merging each into its first prompt"""
+    prompt_store = load_module("prompt_store")
+    prompt_dedup = load_module("prompt_dedup")
+    store = prompt_store.get_store(os.path.abspath(args.prompts_file))
+    clusters = prompt_dedup.find_duplicates(store.snapshot(), args.threshold, set(args.category or ()))
+
+    if args.json:
+        prompt_codec = load_module("prompt_codec")
+        sys.stdout.buffer.write(prompt_codec.dumps(clusters, pretty=True) + b"\n")
+    else:
+        for cluster in clusters:
+            print(f"{len(cluster)} similar prompts:")
+            for prompt in cluster:
+                print(f"  {prompt['similarity']:.2f}  {prompt['category']}/{prompt['prompt_name']}")
+        print(f"{sum(len(cluster) - 1 for cluster in clusters)} duplicates in {len(clusters)} clusters")
+
+    if args.merge and clusters:
+        history = load_module("prompt_history").get_history(store.prompts_file)
+        changes = []
+        for cluster in clusters:
+            keep = (cluster[0]["category"], cluster[0]["prompt_name"])
+            remove = [(prompt["category"], prompt["prompt_name"]) for prompt in cluster[1:]
+                      if prompt["similarity"] >= args.threshold]
+            try:
+                changes += prompt_dedup.merge_prompts(store, history, keep, remove)
+            except ValueError as e:
+                print(f"Skipped the cluster of {keep[0]}/{keep[1]}: {e}")
+        store.flush()
+        print(f"Deleted {len(changes)} duplicates; they can be restored from the prompt history")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    command = subparsers.add_parser("sqlite-import", help=sqlite_import.__doc__)
+    command.add_argument("prompts_file", help="path to prompts.json in the user-db directory")
+    command.add_argument("--source", help="import from this file instead of prompts_file")
+    command.set_defaults(func=sqlite_import)
+
+    command = subparsers.add_parser("sqlite-export", help=sqlite_export.__doc__)
+    command.add_argument("prompts_file", help="path to prompts.json in the user-db directory")
+    command.add_argument("--output", help="write here instead of overwriting prompts_file")
+    command.set_defaults(func=sqlite_export)
+
+    command = subparsers.add_parser("export", help=export.__doc__)
+    command.add_argument("prompts_file", help="path to prompts.json in the user-db directory")
+    command.add_argument("--output", help="write here instead of to stdout")
+    command.set_defaults(func=export)
+
+    command = subparsers.add_parser("duplicates", help=duplicates.__doc__)
+    command.add_argument("prompts_file", help="path to prompts.json in the user-db directory")
+    command.add_argument("--threshold", type=float, default=0.7,
+                         help="share of tags two prompts must have in common (default 0.7)")
+    command.add_argument("--category", action="append", help="only look in this category (repeatable)")
+    command.add_argument("--json", action="store_true", help="print the clusters as JSON")
+    command.add_argument("--merge", action="store_true",
+                         help="keep the first prompt of each cluster and delete the rest")
+    command.set_defaults(func=duplicates)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import math
+import array
+import bisect
+import random
+import hashlib
+from .prompt_metrics import METRICS
+
+# Optional: computes the MinHash signatures in bulk when installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Hash functions per MinHash signature; split into LSH bands of equal rows
+NUM_PERM = 128
+
+# Prompts must land in the same bucket in at least this many bands to be
+# compared; one shared band is too often chance when most prompts share a few tags
+MIN_SHARED_BANDS = 2
+
+# Buckets larger than this (tags nearly every prompt has can cause them) are
+# compared against their first member only, rather than pair by pair
+MAX_BUCKET_SIZE = 64
+
+# Exact comparisons per scan; past this the scan stops and reports what it found
+MAX_COMPARISONS = 2_000_000
+
+# Prompts whose signatures are computed in one numpy batch
+SIGNATURE_BATCH = 4096
+
+# Jaccard similarity of tag sets above which two prompts are near-duplicates
+DEFAULT_THRESHOLD = 0.7
+
+# Hash functions (a * x + b) mod MERSENNE_PRIME, one per signature value; seeded so
+# signatures are the same from run to run
+MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(0x5EED)
+HASH_PARAMS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+def tag_set(text):
+    """Split a prompt into its comma-separated tags, lowercased with whitespace collapsed"""
+    tags = set()
+    for tag in text.split(","):
+        tag = " ".join(tag.lower().split())
+        if tag:
+            tags.add(tag)
+    return frozenset(tags)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_shape(threshold):
+    """Choose (bands, rows) for LSH so that pairs at the threshold are rarely missed.
+
+    A pair with similarity s lands in the same bucket of a band with probability
+    s**rows, and is compared if that happens in MIN_SHARED_BANDS or more bands.
+    The most rows (fewest chance collisions) that still find a pair at the
+    threshold 99% of the time are used.
+    """
+    for rows in range(NUM_PERM // MIN_SHARED_BANDS, 1, -1):
+        bands = NUM_PERM // rows
+        p = threshold ** rows
+        missed = sum(math.comb(bands, k) * p ** k * (1 - p) ** (bands - k) for k in range(MIN_SHARED_BANDS))
+        if missed <= 0.01:
+            return bands, rows
+    return NUM_PERM, 1
+
+
+class TagHasher:
+    """The NUM_PERM hash values of each tag, cached since most tags repeat across a library"""
+
+    def __init__(self):
+        self._hashes = {}
+
+    def __call__(self, tag):
+        values = self._hashes.get(tag)
+        if values is None:
+            value = int.from_bytes(hashlib.blake2b(tag.encode('utf-8'), digest_size=8).digest(), "little")
+            values = self._hashes[tag] = tuple((a * value + b) % MERSENNE_PRIME for a, b in HASH_PARAMS)
+        return values
+
+
+def signatures(tag_sets):
+    """Yield the MinHash signature of each (non-empty) tag set, as bytes or a tuple"""
+    hasher = TagHasher()
+    if numpy is not None:
+        # One vectorised minimum per prompt over all of its tags' hash values, a
+        # batch of prompts at a time so the matrix stays small
+        for start in range(0, len(tag_sets), SIGNATURE_BATCH):
+            batch = tag_sets[start:start + SIGNATURE_BATCH]
+            matrix = numpy.array([hasher(tag) for tags in batch for tag in tags], dtype=numpy.uint64)
+            offsets = numpy.cumsum([0] + [len(tags) for tags in batch[:-1]])
+            for row in numpy.minimum.reduceat(matrix, offsets, axis=0):
+                yield row.tobytes()
+        return
+    for tags in tag_sets:
+        yield tuple(map(min, zip(*(hasher(tag) for tag in tags))))
+
+
+def band_keys(signature, bands, rows):
+    """The LSH bucket key of each band of one signature, hashed down to a compact array"""
+    if isinstance(signature, bytes):
+        rows *= 8
+    return array.array('q', (hash(signature[band * rows:(band + 1) * rows]) for band in range(bands)))
+
+
+def find_duplicates(prompts_db, threshold=DEFAULT_THRESHOLD, categories=None):
+    """Group near-duplicate prompts by the Jaccard similarity of their tag sets.
+
+    Candidates come from MinHash/LSH buckets and are compared exactly. Capping
+    bucket sizes and the number of comparisons keeps the work growing with the
+    library rather than with its square.
+    Returns clusters (largest first), each a list of prompts in library order
+    with their similarity to the first one, which is the suggested prompt to
+    keep; every prompt in a cluster meets the threshold against it.
+    """
+    with METRICS.timer("dedup_scan"):
+        keys = []
+        tag_sets = []
+        texts = []
+        for category, category_prompts in prompts_db.items():
+            if not isinstance(category_prompts, dict) or (categories and category not in categories):
+                continue
+            for prompt_name, prompt_text in category_prompts.items():
+                tags = tag_set(prompt_text or "")
+                if tags:
+                    keys.append((category, prompt_name))
+                    tag_sets.append(tags)
+                    texts.append(prompt_text)
+
+        # Prompts with the same tags are grouped up front and hashed once
+        same_tags = {}
+        for index, tags in enumerate(tag_sets):
+            same_tags.setdefault(tags, []).append(index)
+        unique = [indices[0] for indices in same_tags.values()]
+
+        bands, rows = lsh_shape(threshold)
+        buckets = [{} for _ in range(bands)]
+        unique_keys = []
+        for index, signature in zip(unique, signatures([tag_sets[index] for index in unique])):
+            prompt_keys = band_keys(signature, bands, rows)
+            unique_keys.append(prompt_keys)
+            for band, key in enumerate(prompt_keys):
+                buckets[band].setdefault(key, []).append(index)
+
+        # Verified matches between distinct tag sets, by their first prompt. Each
+        # prompt counts the later prompts it shares buckets with, so every pair is
+        # considered once without keeping a set of the pairs seen
+        matches = {}
+        comparisons = 0
+        for index, prompt_keys in zip(unique, unique_keys):
+            # shared[n] holds the prompts met in more than n bands so far
+            shared = [set() for _ in range(MIN_SHARED_BANDS)]
+            for band, key in enumerate(prompt_keys):
+                members = buckets[band][key]
+                if len(members) <= MAX_BUCKET_SIZE:
+                    members = members[bisect.bisect_right(members, index):]
+                elif members[0] == index:
+                    members = members[1:]
+                else:
+                    continue
+                for count in range(MIN_SHARED_BANDS - 1, 0, -1):
+                    shared[count].update(shared[count - 1].intersection(members))
+                shared[0].update(members)
+            for other in shared[-1]:
+                comparisons += 1
+                if jaccard(tag_sets[index], tag_sets[other]) >= threshold:
+                    matches.setdefault(index, set()).add(other)
+                    matches.setdefault(other, set()).add(index)
+            if comparisons > MAX_COMPARISONS:
+                print(f"Duplicate scan stopped after {comparisons} comparisons; some duplicates may be missing")
+                break
+        METRICS.count("dedup_comparisons", comparisons)
+
+        # Each cluster is built around its first prompt in library order, and
+        # only holds prompts that match that one, so similarity isn't chained
+        # through intermediate prompts
+        assigned = set()
+        clusters = []
+        for keep in range(len(keys)):
+            if keep in assigned:
+                continue
+            representative = same_tags[tag_sets[keep]][0]
+            members = [index for index in same_tags[tag_sets[keep]] if index not in assigned]
+            for match in matches.get(representative, ()):
+                members += [index for index in same_tags[tag_sets[match]] if index not in assigned]
+            if len(members) < 2:
+                continue
+            members.sort()
+            assigned.update(members)
+            clusters.append([{
+                "category": keys[index][0],
+                "prompt_name": keys[index][1],
+                "prompt_text": texts[index],
+                "similarity": round(jaccard(tag_sets[keep], tag_sets[index]), 3),
+            } for index in members])
+        clusters.sort(key=len, reverse=True)
+        return clusters
+
+
+def merge_prompts(store, history, keep, remove, prompt_text=None):
+    """Merge duplicates into one prompt through the store's normal edit path.
+
+    keep and remove are (category, prompt_name) pairs. The kept prompt gets
+    prompt_text if given, and the others are deleted. Every removal is checked
+    first, so a prompt that can't be deleted (e.g. from a read-only pack) raises
+    ValueError before anything changes. The changes are recorded in history and
+    returned as (category, prompt_name, new_text, previous_text); the caller
+    commits the store.
+    """
+    remove = [tuple(pair) for pair in remove if tuple(pair) != tuple(keep)]
+    with history.locked():
+        with store.locked():
+            for category, prompt_name in remove:
+                store.check_delete(category, prompt_name)
+            previous = store.get_texts([tuple(keep)] + remove)
+            changes = []
+            if prompt_text is not None and prompt_text != previous[0]:
+                store.set_prompt(keep[0], keep[1], prompt_text)
+                changes.append((keep[0], keep[1], prompt_text, previous[0]))
+            for (category, prompt_name), old_text in zip(remove, previous[1:]):
+                if store.delete_prompt(category, prompt_name):
+                    changes.append((category, prompt_name, "", old_text))
+        history.record_many(changes)
+    return changes
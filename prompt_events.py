@@ -0,0 +1,70 @@
+import os
+import asyncio
+import server
+from .prompt_db import get_prompt_store
+from .prompt_store import run_blocking
+
+# Websocket event carrying library changes to the browser
+CHANGE_EVENT = "prompt_db.change"
+
+# Seconds between checks for edits made outside ComfyUI (another process, a
+# text editor, a synced folder); 0 turns the check off
+WATCH_INTERVAL = float(os.environ.get("PROMPT_DB_WATCH_INTERVAL", 2))
+
+
+def change_message(store, event):
+    """Build the websocket payload for a store event.
+
+    A "set" carries the edited prompt plus the library version before and after
+    it, so a client whose cache was current can patch it and keep it current.
+    Anything else is a "reload": the client should revalidate what it shows.
+    """
+    version = f"{store.epoch}-{store.version}"
+    if event[0] == "set":
+        _, category, prompt_name, prompt_text = event
+        return {
+            "type": "set",
+            "category": category,
+            "prompt_name": prompt_name,
+            "prompt_text": prompt_text,
+            "version": version,
+            "previous": f"{store.epoch}-{store.version - 1}",
+        }
+    return {"type": "reload", "version": version}
+
+
+def watch_changes(store):
+    """Push every change to the store to all connected clients"""
+    def broadcast(event):
+        # send_sync only queues the message, so this is cheap enough to run
+        # under the store lock, and it keeps events in version order
+        server.PromptServer.instance.send_sync(CHANGE_EVENT, change_message(store, event))
+
+    store.add_listener(broadcast)
+
+
+async def poll_store(store, interval=WATCH_INTERVAL):
+    """Revalidate the store periodically so outside edits are noticed without a request.
+
+    refresh() only stats the library (or checks SQLite's data_version), and
+    notifies listeners, and so the clients, when something changed.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_blocking(store.refresh)
+        except Exception as e:
+            print(f"Error checking the prompt library for changes: {e}")
+
+
+def start():
+    store = get_prompt_store()
+    watch_changes(store)
+
+    loop = getattr(server.PromptServer.instance, "loop", None)
+    if WATCH_INTERVAL > 0 and loop is not None:
+        # Safe before the loop is running: the task starts with the server
+        asyncio.run_coroutine_threadsafe(poll_store(store), loop)
+
+
+start()
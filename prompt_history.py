@@ -0,0 +1,260 @@
+import os
+import time
+import difflib
+import hashlib
+import threading
+from collections import OrderedDict
+from .prompt_store import write_atomic
+from .prompt_metrics import METRICS
+from . import prompt_codec
+
+# Every this many revisions a full copy of the text is stored instead of a delta,
+# so viewing any revision applies at most this many deltas
+SNAPSHOT_EVERY = 10
+
+# Revisions kept per prompt; older ones are dropped. 0 keeps everything
+HISTORY_MAX_REVISIONS = max(int(os.environ.get("PROMPT_DB_HISTORY_MAX", 100)), 0)
+
+# Prompts whose latest revision is kept in memory, to save re-reading their file
+TAIL_CACHE_SIZE = 256
+
+
+def make_delta(old, new):
+    """Encode new as edits to old: a positive int copies that many characters of
+    old, a negative int skips that many, and a string is inserted as is"""
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(i2 - i1)
+            continue
+        if i2 > i1:
+            delta.append(i1 - i2)
+        if j2 > j1:
+            delta.append(new[j1:j2])
+    return delta
+
+
+def apply_delta(old, delta):
+    parts = []
+    position = 0
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.append(old[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(parts)
+
+
+class PromptHistory:
+    """Revision history of every prompt, kept apart from the library.
+
+    Each prompt has its own append-only file in the history directory, named by
+    a hash of its category and name, with one JSON record per revision: either a
+    full "text" snapshot or a "delta" against the revision before. Nothing is
+    loaded until a prompt's history is asked for or a new revision is recorded,
+    so reading prompts costs the same with or without history.
+    """
+
+    def __init__(self, history_dir):
+        self.history_dir = history_dir
+        self._lock = threading.RLock()
+        # path -> (file stat, revision count, latest revision record, latest text)
+        self._tails = OrderedDict()
+
+    def _path(self, category, prompt_name):
+        digest = hashlib.sha1(f"{category}\0{prompt_name}".encode('utf-8')).hexdigest()
+        return os.path.join(self.history_dir, digest[:2], f"{digest}.jsonl")
+
+    def _read(self, path):
+        """Parse a history file into its records, skipping a torn last line"""
+        try:
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(prompt_codec.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    @staticmethod
+    def _texts(records):
+        """Yield the text of each revision in order"""
+        text = ""
+        for record in records:
+            text = record["text"] if "text" in record else apply_delta(text, record["delta"])
+            yield text
+
+    def _tail(self, path):
+        """Return (revision count, latest record, latest text) for a history file"""
+        try:
+            stat = os.stat(path)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return 0, None, None
+        cached = self._tails.get(path)
+        if cached is not None and cached[0] == stat_key:
+            self._tails.move_to_end(path)
+            return cached[1:]
+
+        records = self._read(path)
+        text = None
+        for text in self._texts(records):
+            pass
+        tail = (len(records), records[-1] if records else None, text)
+        self._remember(path, tail)
+        return tail
+
+    def _remember(self, path, tail):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._tails[path] = ((stat.st_mtime_ns, stat.st_size),) + tuple(tail)
+        self._tails.move_to_end(path)
+        while len(self._tails) > TAIL_CACHE_SIZE:
+            self._tails.popitem(last=False)
+
+    def _record(self, category, prompt_name, prompt_text, previous, restored_from):
+        path = self._path(category, prompt_name)
+        count, last, last_text = self._tail(path)
+
+        lines = []
+        if last is None and previous:
+            # First edit of a prompt that predates its history: keep what it replaced
+            last = {"rev": 1, "time": time.time(), "category": category, "prompt_name": prompt_name,
+                    "size": len(previous), "text": previous}
+            lines.append(last)
+            count, last_text = 1, previous
+        if last_text == prompt_text:
+            return None
+
+        rev = last["rev"] + 1 if last else 1
+        record = {"rev": rev, "time": time.time(), "size": len(prompt_text)}
+        if restored_from is not None:
+            record["restored_from"] = restored_from
+        delta = make_delta(last_text, prompt_text) if last_text is not None and count % SNAPSHOT_EVERY else None
+        if delta is None or len(prompt_codec.dumps(delta)) >= len(prompt_text):
+            record.update({"category": category, "prompt_name": prompt_name, "text": prompt_text})
+        else:
+            record["delta"] = delta
+        lines.append(record)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with METRICS.timer("history_write"), open(path, 'ab') as f:
+            f.write(b"".join(prompt_codec.dumps(line) + b"\n" for line in lines))
+        count += len(lines)
+
+        if HISTORY_MAX_REVISIONS and count > HISTORY_MAX_REVISIONS + SNAPSHOT_EVERY:
+            count = self._prune(path)
+        self._remember(path, (count, record, prompt_text))
+        return rev
+
+    def _prune(self, path):
+        """Drop the oldest revisions, turning the first one kept into a snapshot"""
+        records = self._read(path)
+        texts = list(self._texts(records))
+        start = len(records) - HISTORY_MAX_REVISIONS
+        kept = records[start:]
+        first = {key: value for key, value in kept[0].items() if key != "delta"}
+        first.update({"category": records[0].get("category"), "prompt_name": records[0].get("prompt_name"),
+                      "text": texts[start]})
+        kept[0] = first
+        write_atomic(path, b"".join(prompt_codec.dumps(record) + b"\n" for record in kept))
+        return len(kept)
+
+    def locked(self):
+        """Hold the history lock across a library edit and its record() calls.
+
+        Edits that take it are recorded in the order they were made, even when
+        they run on different threads.
+        """
+        return self._lock
+
+    def record(self, category, prompt_name, prompt_text, previous=None, restored_from=None):
+        """Add a revision if the text changed; returns its number, or None.
+
+        previous is the text being replaced. It is stored first when the prompt
+        has no history yet, so the first edit can be undone as well.
+        """
+        with self._lock:
+            return self._record(category, prompt_name, prompt_text, previous, restored_from)
+
+    def replace(self, store, category, prompt_name, prompt_text, restored_from=None):
+        """Set a prompt in store and record the revision as one step.
+
+        Returns (previous text, is_new_category) from store.replace_prompt().
+        Creating a prompt with no text isn't recorded.
+        """
+        with self.locked():
+            previous, is_new_category = store.replace_prompt(category, prompt_name, prompt_text)
+            if previous or prompt_text:
+                self._record(category, prompt_name, prompt_text, previous, restored_from)
+            return previous, is_new_category
+
+    def delete(self, store, category, prompt_name):
+        """Delete a prompt from store and record it as an empty revision, so it can be restored.
+
+        Returns the deleted text, or None if there was no such prompt.
+        """
+        with self.locked():
+            previous = store.pop_prompt(category, prompt_name)
+            if previous is not None:
+                self._record(category, prompt_name, "", previous, None)
+            return previous
+
+    def record_many(self, changes):
+        """Record (category, prompt_name, prompt_text, previous) changes, e.g. after an import"""
+        with self._lock:
+            for category, prompt_name, prompt_text, previous in changes:
+                self._record(category, prompt_name, prompt_text, previous, None)
+
+    def revisions(self, category, prompt_name):
+        """List a prompt's revisions, newest first, without their texts"""
+        with self._lock:
+            records = self._read(self._path(category, prompt_name))
+        revisions = []
+        for record in reversed(records):
+            revision = {"rev": record["rev"], "time": record["time"], "size": record.get("size", 0),
+                        "kind": "snapshot" if "text" in record else "delta"}
+            if "restored_from" in record:
+                revision["restored_from"] = record["restored_from"]
+            revisions.append(revision)
+        return revisions
+
+    def revision(self, category, prompt_name, rev):
+        """Return (record, text) for one revision, or (None, None) if it doesn't exist"""
+        with self._lock:
+            records = self._read(self._path(category, prompt_name))
+        # Start from the newest snapshot at or before the revision
+        end = next((index for index, record in enumerate(records) if record["rev"] == rev), None)
+        if end is None:
+            return None, None
+        start = end
+        while start > 0 and "text" not in records[start]:
+            start -= 1
+        text = None
+        for text in self._texts(records[start:end + 1]):
+            pass
+        return records[end], text
+
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(prompts_file):
+    """Return the shared history for a prompts file, kept in history/ next to it"""
+    history_dir = os.path.join(os.path.dirname(os.path.abspath(prompts_file)), "history")
+    with _histories_lock:
+        history = _histories.get(history_dir)
+        if history is None:
+            history = _histories[history_dir] = PromptHistory(history_dir)
+        return history
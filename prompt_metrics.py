@@ -0,0 +1,157 @@
+import time
+import functools
+import threading
+import contextlib
+from collections import deque
+
+# Recent samples kept per timer for percentiles
+RESERVOIR_SIZE = 1024
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Timer:
+    """Call count, total and max duration, plus the most recent samples"""
+
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def quantiles(self):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """Process-wide timers and counters for the prompt DB hot paths.
+
+    Timers and counters are keyed by (name, label); the label is a route path or
+    empty. Recording is a dict lookup and a few additions under a lock, cheap
+    enough to leave on in production.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds, label=""):
+        with self._lock:
+            timer = self._timers.get((name, label))
+            if timer is None:
+                timer = self._timers[(name, label)] = Timer()
+            timer.add(seconds)
+
+    def count(self, name, amount=1, label=""):
+        with self._lock:
+            self._counters[(name, label)] = self._counters.get((name, label), 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name, label=""):
+        """Time the body of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, label)
+
+    def snapshot(self):
+        """Return every timer and counter as JSON-friendly dicts, times in milliseconds"""
+        with self._lock:
+            timers = {}
+            for (name, label), timer in sorted(self._timers.items()):
+                quantiles = timer.quantiles()
+                timers[f"{name} {label}".strip()] = {
+                    "count": timer.count,
+                    "total_ms": timer.total * 1000,
+                    "mean_ms": timer.total / timer.count * 1000,
+                    "max_ms": timer.max * 1000,
+                    "p50_ms": quantiles[0.5] * 1000,
+                    "p90_ms": quantiles[0.9] * 1000,
+                    "p99_ms": quantiles[0.99] * 1000,
+                }
+            counters = {f"{name} {label}".strip(): value for (name, label), value in sorted(self._counters.items())}
+        return {"uptime_s": time.time() - self.started, "timers": timers, "counters": counters}
+
+    def prometheus(self, gauges=None):
+        """Render the metrics in the Prometheus text exposition format.
+
+        gauges is an optional {name: number} dict of point-in-time values, such
+        as the store's cache statistics.
+        """
+        def labels(name, label, **extra):
+            pairs = [("name", name)] + ([("label", label)] if label else []) + list(extra.items())
+            return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+        lines = ["# HELP prompt_db_duration_seconds Time spent in prompt DB routes and storage operations",
+                 "# TYPE prompt_db_duration_seconds summary"]
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+            for (name, label), timer in timers:
+                for q, value in timer.quantiles().items():
+                    lines.append(f"prompt_db_duration_seconds{labels(name, label, quantile=q)} {value:.9f}")
+                lines.append(f"prompt_db_duration_seconds_sum{labels(name, label)} {timer.total:.9f}")
+                lines.append(f"prompt_db_duration_seconds_count{labels(name, label)} {timer.count}")
+        lines.append("# HELP prompt_db_duration_seconds_max Longest single duration observed")
+        lines.append("# TYPE prompt_db_duration_seconds_max gauge")
+        for (name, label), timer in timers:
+            lines.append(f"prompt_db_duration_seconds_max{labels(name, label)} {timer.max:.9f}")
+        lines.append("# HELP prompt_db_events_total Counted prompt DB events (calls, bytes, cache hits)")
+        lines.append("# TYPE prompt_db_events_total counter")
+        for (name, label), value in counters:
+            lines.append(f"prompt_db_events_total{labels(name, label)} {value}")
+        if gauges:
+            lines.append("# HELP prompt_db_state Point-in-time prompt DB state")
+            lines.append("# TYPE prompt_db_state gauge")
+            for name, value in sorted(gauges.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"prompt_db_state{labels(name, '')} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+def timed_route(handler):
+    """Record duration, status, and request/response bytes for an aiohttp handler"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        path = request.path
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        finally:
+            METRICS.observe("route", time.perf_counter() - start, path)
+            METRICS.count("requests", label=path)
+            if status >= 500:
+                METRICS.count("errors", label=path)
+            METRICS.count("request_bytes", request.content_length or 0, label=path)
+            if status < 500:
+                # Plain responses still hold their body; streamed ones have counted what they sent
+                body = getattr(response, "body", None)
+                body_bytes = len(body) if isinstance(body, (bytes, bytearray)) else response.body_length
+                METRICS.count("response_bytes", body_bytes, label=path)
+    return wrapper
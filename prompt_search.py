@@ -0,0 +1,392 @@
+import re
+import heapq
+import bisect
+import operator
+import threading
+from collections import Counter, defaultdict
+from .prompt_metrics import METRICS
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Minimum trigram similarity for a fuzzy name match
+FUZZY_THRESHOLD = 0.3
+
+# A one-word query shorter than this only matches whole words in prompt texts,
+# not as a prefix: one or two letters would expand to a large share of the
+# vocabulary. Names are still matched by prefix
+MIN_TEXT_PREFIX_LENGTH = 3
+
+# Match kinds, best first; results are ranked by kind, then by score within it
+MATCH_EXACT = "exact"
+MATCH_PREFIX = "prefix"
+MATCH_NAME = "name"
+MATCH_WORDS = "words"
+MATCH_TEXT = "text"
+MATCH_FUZZY = "fuzzy"
+
+
+def trigrams(value, pad=True):
+    """Return the set of character trigrams of a lowercased string.
+
+    Padding adds grams for the start and end of the string, which helps fuzzy
+    ranking; substring lookups use the unpadded grams.
+    """
+    if pad:
+        value = f"  {value} "
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def words(value):
+    return set(WORD_RE.findall(value.lower()))
+
+
+class PromptSearchIndex:
+    """Incrementally maintained search index over prompt names and texts.
+
+    Names are indexed by trigram (substring and fuzzy matches) and by word; texts
+    are indexed by word. A sorted vocabulary gives prefix matching for the last
+    word being typed. The index follows the store through its listener hook: an
+    edit or deletion updates just that prompt, and a reload marks the index
+    stale so the next search rebuilds it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._stale = True
+        # Store events that arrive while a rebuild reads the snapshot
+        self._backlog = None
+        self._clear()
+        store.add_listener(self._on_store_event)
+
+    def _clear(self):
+        self._next_id = 0
+        self._ids = {}                          # (category, name) -> doc id
+        self._docs = {}                         # doc id -> (category, name, name_lower, name_words, text_words, gram_count)
+        self._name_grams = defaultdict(set)     # trigram -> doc ids
+        self._name_words = defaultdict(set)     # word -> doc ids (names)
+        self._text_words = defaultdict(set)     # word -> doc ids (texts)
+        self._vocab = []                        # sorted words of both indexes
+
+    def _on_store_event(self, event):
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.append(event)
+            else:
+                self._apply(event)
+
+    def _apply(self, event):
+        if event[0] == "set" and not self._stale:
+            self._index(event[1], event[2], event[3])
+        elif event[0] == "delete" and not self._stale:
+            self._unindex(event[1], event[2])
+        else:
+            self._stale = True
+
+    def _add_word(self, index, word, doc_id):
+        postings = index.get(word)
+        if postings is None:
+            postings = index[word] = set()
+            position = bisect.bisect_left(self._vocab, word)
+            if position == len(self._vocab) or self._vocab[position] != word:
+                self._vocab.insert(position, word)
+        postings.add(doc_id)
+
+    def _remove_word(self, index, word, doc_id):
+        postings = index.get(word)
+        if postings is None:
+            return
+        postings.discard(doc_id)
+        if not postings:
+            del index[word]
+            if word not in self._name_words and word not in self._text_words:
+                position = bisect.bisect_left(self._vocab, word)
+                if position < len(self._vocab) and self._vocab[position] == word:
+                    del self._vocab[position]
+
+    def _index(self, category, prompt_name, prompt_text):
+        """Add or replace one prompt in the index"""
+        key = (category, prompt_name)
+        doc_id = self._ids.get(key)
+        name_lower = prompt_name.lower()
+        text_words = words(prompt_text or "")
+
+        if doc_id is not None:
+            # Only the text can change for an existing (category, name)
+            doc = self._docs[doc_id]
+            old_text_words = doc[4]
+            for word in old_text_words - text_words:
+                self._remove_word(self._text_words, word, doc_id)
+            for word in text_words - old_text_words:
+                self._add_word(self._text_words, word, doc_id)
+            self._docs[doc_id] = doc[:4] + (text_words,) + doc[5:]
+            return
+
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[key] = doc_id
+        name_words = words(prompt_name)
+        name_grams = trigrams(name_lower)
+        for gram in name_grams:
+            self._name_grams[gram].add(doc_id)
+        for word in name_words:
+            self._add_word(self._name_words, word, doc_id)
+        for word in text_words:
+            self._add_word(self._text_words, word, doc_id)
+        self._docs[doc_id] = (category, prompt_name, name_lower, name_words, text_words, len(name_grams))
+
+    def _unindex(self, category, prompt_name):
+        """Remove one prompt from the index"""
+        doc_id = self._ids.pop((category, prompt_name), None)
+        if doc_id is None:
+            return
+        _, _, name_lower, name_words, text_words, _ = self._docs.pop(doc_id)
+        for gram in trigrams(name_lower):
+            postings = self._name_grams.get(gram)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._name_grams[gram]
+        for word in name_words:
+            self._remove_word(self._name_words, word, doc_id)
+        for word in text_words:
+            self._remove_word(self._text_words, word, doc_id)
+
+    @staticmethod
+    def _build(prompts_db):
+        """Index a whole snapshot into new structures, in the order _clear sets them up.
+
+        Runs without the index lock, so saves aren't held up by a rebuild; the
+        vocabulary is sorted once at the end rather than kept sorted word by word.
+        """
+        ids = {}
+        docs = {}
+        name_grams = defaultdict(set)
+        name_words_index = defaultdict(set)
+        text_words_index = defaultdict(set)
+        doc_id = 0
+        for category, category_prompts in prompts_db.items():
+            if not isinstance(category_prompts, dict):
+                continue
+            for prompt_name, prompt_text in category_prompts.items():
+                name_lower = prompt_name.lower()
+                name_words = words(prompt_name)
+                text_words = words(prompt_text if isinstance(prompt_text, str) else "")
+                grams = trigrams(name_lower)
+                for gram in grams:
+                    name_grams[gram].add(doc_id)
+                for word in name_words:
+                    name_words_index[word].add(doc_id)
+                for word in text_words:
+                    text_words_index[word].add(doc_id)
+                ids[(category, prompt_name)] = doc_id
+                docs[doc_id] = (category, prompt_name, name_lower, name_words, text_words, len(grams))
+                doc_id += 1
+        vocab = sorted(name_words_index.keys() | text_words_index.keys())
+        return doc_id, ids, docs, name_grams, name_words_index, text_words_index, vocab
+
+    def _refresh(self):
+        """Rebuild the index from a store snapshot if it is stale.
+
+        Listeners run under the store lock and then take the index lock, so the
+        snapshot is read and indexed without holding the index lock, and saves
+        don't wait for a rebuild. Events arriving in the meantime are queued and
+        replayed afterwards; replaying an edit that the snapshot already contains
+        is harmless.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                if not self._stale:
+                    return
+            # Let the store pick up outside changes first, so the reload it reports
+            # is not queued against the snapshot taken below
+            self.store.refresh()
+            with self._lock:
+                self._backlog = []
+            try:
+                prompts_db = self.store.snapshot()
+                with METRICS.timer("search_rebuild"):
+                    built = self._build(prompts_db)
+            except BaseException:
+                with self._lock:
+                    self._backlog = None
+                raise
+            with self._lock:
+                (self._next_id, self._ids, self._docs, self._name_grams, self._name_words, self._text_words,
+                 self._vocab) = built
+                self._stale = False
+                backlog, self._backlog = self._backlog, None
+                for event in backlog:
+                    self._apply(event)
+
+    def _prefix_postings(self, index, prefix):
+        """Union of the postings of every word in index starting with prefix"""
+        result = set()
+        position = bisect.bisect_left(self._vocab, prefix)
+        while position < len(self._vocab) and self._vocab[position].startswith(prefix):
+            postings = index.get(self._vocab[position])
+            if postings:
+                result |= postings
+            position += 1
+        return result
+
+    def _word_matches(self, index, tokens, min_prefix_length=1):
+        """Docs where every token appears, the last one only as a prefix (it may be half typed)"""
+        matches = None
+        for i, token in enumerate(tokens):
+            if i == len(tokens) - 1 and len(token) >= min_prefix_length:
+                postings = self._prefix_postings(index, token)
+            else:
+                postings = index.get(token, set())
+            matches = set(postings) if matches is None else matches & postings
+            if not matches:
+                return set()
+        return matches or set()
+
+    def _fuzzy_matches(self, query, exclude):
+        """Name matches by trigram similarity, for typos and reordered words"""
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._name_grams.get(gram, ()))
+        # The union of grams is at least the query's, so a doc sharing fewer than
+        # this many can't reach the threshold whatever its length
+        min_shared = FUZZY_THRESHOLD * len(query_grams)
+        docs = self._docs
+        scores = {}
+        for doc_id, count in shared.items():
+            if count < min_shared or doc_id in exclude:
+                continue
+            similarity = count / (len(query_grams) + docs[doc_id][5] - count)
+            if similarity >= FUZZY_THRESHOLD:
+                scores[doc_id] = similarity
+        return scores
+
+    def search(self, query, category=None, offset=0, limit=50, fuzzy=True):
+        """Return (results, total) for a query, best matches first.
+
+        Each result is a dict with category, prompt_name, match and score. Fuzzy
+        matches rank after every name and text match and are only looked up once
+        the page reaches them, so total includes them only from that point on.
+        """
+        query = " ".join(query.lower().split())
+        if not query:
+            return [], 0
+        tokens = WORD_RE.findall(query)
+
+        self._refresh()
+        with self._lock:
+            docs = self._docs
+            end = offset + limit
+
+            # Substring matches on the name, via trigrams when the query is long enough
+            if len(query) >= 3:
+                candidates = None
+                for gram in trigrams(query, pad=False):
+                    postings = self._name_grams.get(gram, set())
+                    candidates = set(postings) if candidates is None else candidates & postings
+                    if not candidates:
+                        break
+                candidates = candidates or set()
+            else:
+                candidates = self._prefix_postings(self._name_words, tokens[0]) if tokens else set()
+
+            # Ranked exact, prefix, then inner matches, shorter names first; the sort
+            # key is built here so ranking needs no Python call per match
+            matched = []
+            for doc_id in candidates:
+                name_lower = docs[doc_id][2]
+                position = name_lower.find(query)
+                if position < 0:
+                    continue
+                rank = 2 if position else (0 if len(name_lower) == len(query) else 1)
+                matched.append((rank, len(name_lower), doc_id))
+            if category is not None:
+                matched = [item for item in matched if docs[item[2]][0] == category]
+            seen = {item[2] for item in matched}
+            kinds = (MATCH_EXACT, MATCH_PREFIX, MATCH_NAME)
+            scored = [(kinds[rank], len(query) / length, doc_id)
+                      for rank, length, doc_id in heapq.nsmallest(end, matched)]
+
+            # Every word in the name, in any order; a one-word query matched them all above
+            word_matches = set()
+            if tokens and tokens != [query]:
+                word_matches = self._word_matches(self._name_words, tokens) - seen
+                if category is not None:
+                    word_matches = {doc_id for doc_id in word_matches if docs[doc_id][0] == category}
+                seen |= word_matches
+            if len(scored) < end and word_matches:
+                scored.extend(heapq.nsmallest(
+                    end - len(scored),
+                    ((MATCH_WORDS, len(tokens) / max(len(docs[doc_id][3]), 1), doc_id) for doc_id in word_matches),
+                    key=lambda item: (-item[1], item[2])))
+            scored_count = len(matched) + len(word_matches)
+
+            # Every word in the text; usually the bulk of the results, so not scored per doc
+            text_matches = set()
+            if tokens:
+                min_prefix_length = MIN_TEXT_PREFIX_LENGTH if len(tokens) == 1 else 1
+                text_matches = self._word_matches(self._text_words, tokens, min_prefix_length) - seen
+            if category is not None:
+                text_matches = {doc_id for doc_id in text_matches if docs[doc_id][0] == category}
+
+            # Fuzzy matches rank last, so only pay for them when the page reaches them
+            fuzzy_scores = {}
+            if fuzzy and len(query) >= 3 and scored_count + len(text_matches) < end:
+                fuzzy_scores = self._fuzzy_matches(query, seen | text_matches)
+                if category is not None:
+                    fuzzy_scores = {doc_id: similarity for doc_id, similarity in fuzzy_scores.items()
+                                    if docs[doc_id][0] == category}
+            total = scored_count + len(text_matches) + len(fuzzy_scores)
+
+            # Walk the tiers in rank order and only materialize the requested page
+            page = []
+            if offset < len(scored):
+                page.extend(scored[offset:end])
+            text_start = max(offset - scored_count, 0)
+            text_end = end - scored_count
+            if text_end > 0 and text_start < len(text_matches):
+                # Text matches keep library order (doc id), cheapest to page through
+                for doc_id in heapq.nsmallest(text_end, text_matches)[text_start:]:
+                    page.append((MATCH_TEXT, 0.0, doc_id))
+            fuzzy_start = max(offset - scored_count - len(text_matches), 0)
+            fuzzy_end = end - scored_count - len(text_matches)
+            if fuzzy_end > 0 and fuzzy_scores:
+                # Most similar first; only the page is ranked, not every fuzzy match
+                ranked = heapq.nsmallest(fuzzy_end, zip(map(operator.neg, fuzzy_scores.values()), fuzzy_scores))
+                for negated, doc_id in ranked[fuzzy_start:]:
+                    page.append((MATCH_FUZZY, -negated, doc_id))
+
+            results = []
+            for kind, score, doc_id in page:
+                doc_category, prompt_name = self._docs[doc_id][:2]
+                results.append({
+                    "category": doc_category,
+                    "prompt_name": prompt_name,
+                    "match": kind,
+                    "score": round(score, 4),
+                })
+            return results, total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stale": self._stale,
+                "prompts": len(self._docs),
+                "words": len(self._vocab),
+                "trigrams": len(self._name_grams),
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(store):
+    """Return the search index that follows a store, creating it on first use"""
+    with _indexes_lock:
+        index = _indexes.get(id(store))
+        if index is None:
+            index = _indexes[id(store)] = PromptSearchIndex(store)
+        return index
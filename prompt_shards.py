@@ -0,0 +1,417 @@
+import os
+import glob
+import itertools
+from urllib.parse import quote, unquote
+from .prompt_store import (DEFAULT_PROMPTS, IMPORT_STRATEGIES, PromptStore, free_prompt_name,
+                           import_counts, write_atomic)
+from .prompt_metrics import METRICS
+from . import prompt_codec
+
+SHARD_SUFFIX = ".json"
+
+
+def shard_filename(category):
+    """File name for a category's shard; the category name is percent-encoded"""
+    return quote(category, safe=" ") + SHARD_SUFFIX
+
+
+def shard_category(filename):
+    return unquote(filename[:-len(SHARD_SUFFIX)])
+
+
+def stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class Shard:
+    """One category file: {prompt_name: prompt_text}, parsed on first use"""
+
+    __slots__ = ("path", "read_only", "stat_key", "prompts")
+
+    def __init__(self, path, read_only):
+        self.path = path
+        self.read_only = read_only
+        self.stat_key = None
+        # None until loaded; replaced, never mutated, when edited
+        self.prompts = None
+
+
+class ShardedPromptStore(PromptStore):
+    """Prompt store with one JSON file per category, plus read-only shared packs.
+
+    The library lives in prompts.d/ next to prompts.json, one <category>.json
+    per category. Packs are directories with the same layout, found in
+    user-db/packs/* and in the PROMPT_DB_PACKS path list; they are never
+    written to. Startup only lists file names: a shard is parsed the first time
+    its category is read, and each shard is revalidated against its own stat.
+    The prompt names of every shard, which the node option lists need, come
+    from shard_names.json while a shard's file is unchanged since it was last
+    parsed. A save rewrites only the shards it touched.
+
+    A category present in several places is merged, pack prompts first; edits
+    always go to the user's shard, so a pack prompt can be overridden locally.
+    Categories are listed in name order.
+    """
+
+    def __init__(self, prompts_file):
+        super().__init__(prompts_file)
+        self.shard_dir = os.path.join(os.path.dirname(prompts_file), "prompts.d")
+        self.pack_dirs = sorted(glob.glob(os.path.join(os.path.dirname(prompts_file), "packs", "*", "")))
+        self.pack_dirs += [path for path in os.environ.get("PROMPT_DB_PACKS", "").split(os.pathsep) if path]
+        # category -> shards, packs first and the user's shard (if any) last
+        self._layout = {}
+        self._dir_keys = None
+        self._dirty_shards = set()
+        self._snapshot_cache = None
+        # shard path -> [stat key, prompt names], loaded on first use
+        self.names_file = os.path.join(os.path.dirname(prompts_file), "shard_names.json")
+        self._names_index = None
+
+    def _directories(self):
+        """Directories in merge order: packs first, then the user's prompts.d"""
+        return [(path, True) for path in self.pack_dirs] + [(self.shard_dir, False)]
+
+    def _scan(self):
+        """List the shard files, keeping the parsed contents of shards seen before"""
+        known = {shard.path: shard for shards in self._layout.values() for shard in shards}
+        layout = {}
+        for directory, read_only in self._directories():
+            try:
+                filenames = sorted(name for name in os.listdir(directory) if name.endswith(SHARD_SUFFIX))
+            except OSError:
+                continue
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                shard = known.get(path) or Shard(path, read_only)
+                layout.setdefault(shard_category(filename), []).append(shard)
+        # Shards created in memory but not written yet aren't on disk to be listed
+        for shard in self._dirty_shards:
+            category = shard_category(os.path.basename(shard.path))
+            if shard not in layout.get(category, ()):
+                layout.setdefault(category, []).append(shard)
+        self._layout = dict(sorted(layout.items()))
+
+    def _validate(self, categories=None):
+        """Pick up outside changes to the directories and to loaded shards.
+
+        Only the given categories' shards are checked, or every loaded shard when
+        categories is None. Listeners get a ("reload",) event for any change.
+        """
+        changed = False
+        dir_keys = [stat_key(directory) for directory, _ in self._directories()]
+        if dir_keys != self._dir_keys:
+            self._dir_keys = dir_keys
+            before = {category: list(shards) for category, shards in self._layout.items()}
+            self._scan()
+            changed = before != self._layout
+
+        if categories is None:
+            shards = [shard for shards in self._layout.values() for shard in shards]
+        else:
+            shards = [shard for category in categories for shard in self._layout.get(category, ())]
+        for shard in shards:
+            if shard.prompts is None or shard in self._dirty_shards:
+                continue
+            if stat_key(shard.path) != shard.stat_key:
+                shard.prompts = None
+                changed = True
+
+        if changed:
+            self.misses += 1
+            self.version += 1
+            self._notify(("reload",))
+        else:
+            self.hits += 1
+
+    def _load(self, shard):
+        """Return a shard's prompts, parsing the file on first use"""
+        if shard.prompts is None:
+            shard.stat_key = stat_key(shard.path)
+            try:
+                with METRICS.timer("file_read"), open(shard.path, 'rb') as f:
+                    payload = f.read()
+                METRICS.count("bytes_read", len(payload))
+                with METRICS.timer("json_parse"):
+                    prompts = prompt_codec.loads(payload)
+                shard.prompts = prompts if isinstance(prompts, dict) else {}
+            except FileNotFoundError:
+                shard.prompts = {}
+            except Exception as e:
+                print(f"Error loading {shard.path}: {e}")
+                shard.prompts = {}
+        return shard.prompts
+
+    def _merged(self, category):
+        """A category's prompts across its shards; read-only"""
+        shards = self._layout.get(category, ())
+        if len(shards) == 1:
+            return self._load(shards[0])
+        merged = {}
+        for shard in shards:
+            merged.update(self._load(shard))
+        return merged
+
+    def _check_new_category(self, category, pending=()):
+        """Refuse a category whose shard file would clash with another's on a
+        case-insensitive file system (Windows, macOS), e.g. "Poses" and "poses".
+
+        pending holds categories about to be created alongside it.
+        """
+        if category in self._layout:
+            return
+        filename = shard_filename(category).casefold()
+        for other in itertools.chain(self._layout, pending):
+            if other == category:
+                continue
+            if shard_filename(other).casefold() == filename:
+                raise ValueError(f"Category '{category}' clashes with category '{other}' (file names ignore case on some systems)")
+
+    def _user_shard(self, category):
+        """The writable shard for a category, created in memory if needed"""
+        if category not in self._layout:
+            self._layout[category] = []
+            self._layout = dict(sorted(self._layout.items()))
+        shards = self._layout[category]
+        for shard in shards:
+            if not shard.read_only:
+                return shard
+        shard = Shard(os.path.join(self.shard_dir, shard_filename(category)), False)
+        shard.prompts = {}
+        shards.append(shard)
+        return shard
+
+    def refresh(self):
+        with self._locked():
+            self._validate()
+
+    def ensure_file(self):
+        """Create prompts.d, splitting an existing prompts.json (or the defaults) into shards"""
+        with self._locked():
+            try:
+                if os.path.isdir(self.shard_dir) and os.listdir(self.shard_dir):
+                    return
+                prompts_db = DEFAULT_PROMPTS
+                if os.path.exists(self.prompts_file):
+                    with open(self.prompts_file, 'rb') as f:
+                        prompts_db = prompt_codec.loads(f.read())
+                for category, category_prompts in prompts_db.items():
+                    if isinstance(category_prompts, dict):
+                        path = os.path.join(self.shard_dir, shard_filename(category))
+                        write_atomic(path, self._serialize(category_prompts))
+            except Exception as e:
+                print(f"Error creating prompts.d: {e}")
+
+    def snapshot(self):
+        """Build the whole library as a prompts.json-style dict, loading every shard"""
+        with self._locked():
+            self._validate()
+            if self._snapshot_cache is not None and self._snapshot_cache[0] == self.version:
+                return self._snapshot_cache[1]
+            prompts_db = {category: self._merged(category) for category in self._layout}
+            self._snapshot_cache = (self.version, prompts_db)
+            return prompts_db
+
+    def categories(self):
+        with self._locked():
+            self._validate(())
+            return list(self._layout)
+
+    def prompt_names(self, category):
+        with self._locked():
+            self._validate((category,))
+            return list(self._merged(category))
+
+    def all_prompt_names(self):
+        with self._locked():
+            self._validate()
+            if self._names_index is None:
+                self._names_index = self._read_names_index()
+            index = {}
+            all_prompt_names = set()
+            for shards in self._layout.values():
+                for shard in shards:
+                    all_prompt_names.update(self._shard_names(shard, index))
+            if index != self._names_index:
+                self._names_index = index
+                try:
+                    write_atomic(self.names_file, prompt_codec.dumps(index))
+                except Exception as e:
+                    print(f"Error saving {self.names_file}: {e}")
+            return all_prompt_names
+
+    def _read_names_index(self):
+        try:
+            with open(self.names_file, 'rb') as f:
+                index = prompt_codec.loads(f.read())
+            if isinstance(index, dict):
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading {self.names_file}: {e}")
+        return {}
+
+    def _shard_names(self, shard, index):
+        """A shard's prompt names, without parsing it if the names index is current.
+
+        Adds the shard's entry to index, the names index being rebuilt.
+        """
+        if shard.prompts is None:
+            entry = self._names_index.get(shard.path)
+            key = stat_key(shard.path)
+            if isinstance(entry, list) and len(entry) == 2 and key is not None and entry[0] == list(key):
+                index[shard.path] = entry
+                return entry[1]
+        names = list(self._load(shard))
+        if shard.stat_key is not None and shard not in self._dirty_shards:
+            index[shard.path] = [list(shard.stat_key), names]
+        return names
+
+    def get_text(self, category, prompt_name):
+        with self._locked():
+            self._validate((category,))
+            return self._merged(category).get(prompt_name, "")
+
+    def get_texts(self, pairs):
+        pairs = list(pairs)
+        with self._locked():
+            self._validate({category for category, _ in pairs if isinstance(category, str)})
+            return [self._merged(category).get(prompt_name, "") for category, prompt_name in pairs]
+
+    def iter_categories(self, prefix="", cursor=None):
+        return self._iter_keys(iter(self.categories()), prefix, cursor)
+
+    def iter_prompt_names(self, category, prefix="", cursor=None):
+        return self._iter_keys(iter(self.prompt_names(category)), prefix, cursor)
+
+    def _set(self, category, prompt_name, prompt_text):
+        """Copy-on-write update of the user's shard for a category"""
+        shard = self._user_shard(category)
+        prompts = dict(self._load(shard))
+        prompts[prompt_name] = prompt_text
+        shard.prompts = prompts
+        self._dirty_shards.add(shard)
+
+    def set_prompt(self, category, prompt_name, prompt_text):
+        with self._locked():
+            self._validate((category,))
+            self._check_new_category(category)
+            is_new_category = category not in self._layout
+            self._set(category, prompt_name, prompt_text)
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("set", category, prompt_name, prompt_text))
+            return is_new_category
+
+    def delete_prompt(self, category, prompt_name):
+        """Remove a prompt from the user's shard; returns False if there was none.
+
+        Prompts that come from a pack can't be deleted. Deleting a local override
+        of a pack prompt brings the pack's version back.
+        """
+        with self._locked():
+            self._validate((category,))
+            shards = self._layout.get(category, ())
+            if not shards or prompt_name not in self._merged(category):
+                return False
+            self.check_delete(category, prompt_name)
+
+            shard = shards[-1]
+            prompts = dict(shard.prompts)
+            del prompts[prompt_name]
+            shard.prompts = prompts
+            self._dirty_shards.add(shard)
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("delete", category, prompt_name))
+            return True
+
+    def check_delete(self, category, prompt_name):
+        with self._locked():
+            self._validate((category,))
+            shards = self._layout.get(category, ())
+            if shards and prompt_name in self._merged(category):
+                shard = shards[-1]
+                if shard.read_only or prompt_name not in self._load(shard):
+                    raise ValueError(f"'{category}/{prompt_name}' is in a read-only prompt pack")
+
+    def import_prompts(self, records, on_conflict="overwrite"):
+        if on_conflict not in IMPORT_STRATEGIES:
+            raise ValueError(f"Unknown conflict strategy '{on_conflict}'")
+        counts = import_counts()
+        records = list(records)
+        with self._locked():
+            self._validate({category for category, _, _ in records})
+            # Work on per-category copies so a failure leaves the store untouched
+            merged = {}
+            updates = {}
+            for category, prompt_name, prompt_text in records:
+                if category not in merged:
+                    if category not in self._layout:
+                        self._check_new_category(category, merged)
+                        counts["categories_created"] += 1
+                    merged[category] = dict(self._merged(category))
+                    updates[category] = {}
+                category_prompts = merged[category]
+                if prompt_name in category_prompts:
+                    if on_conflict == "skip":
+                        counts["skipped"] += 1
+                        continue
+                    if on_conflict == "rename":
+                        prompt_name = free_prompt_name(prompt_name, category_prompts.__contains__)
+                        counts["renamed"] += 1
+                    else:
+                        counts["updated"] += 1
+                else:
+                    counts["created"] += 1
+                category_prompts[prompt_name] = prompt_text
+                updates[category][prompt_name] = prompt_text
+
+            updates = {category: prompts for category, prompts in updates.items() if prompts}
+            for category, prompts in updates.items():
+                shard = self._user_shard(category)
+                shard.prompts = {**self._load(shard), **prompts}
+                self._dirty_shards.add(shard)
+            if updates:
+                self._edit_seq += 1
+                self.version += 1
+                self._notify(("reload",))
+        return counts
+
+    def flush(self):
+        """Rewrite the shards edited since the last flush, each one atomically"""
+        with self._flush_lock:
+            with self._locked():
+                if not self._is_dirty():
+                    return
+                seq = self._edit_seq
+                pending = [(shard, shard.prompts) for shard in self._dirty_shards]
+
+            for shard, prompts in pending:
+                write_atomic(shard.path, self._serialize(prompts))
+                with self._locked():
+                    # A shard edited again while it was being written stays dirty
+                    if shard.prompts is prompts:
+                        self._dirty_shards.discard(shard)
+                        shard.stat_key = stat_key(shard.path)
+
+            with self._locked():
+                self._flushed_seq = seq
+                self._dir_keys = [stat_key(directory) for directory, _ in self._directories()]
+
+    def stats(self):
+        with self._locked():
+            shards = [shard for shards in self._layout.values() for shard in shards]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.version,
+                "pending_edits": self._edit_seq - self._flushed_seq,
+                "categories": len(self._layout),
+                "shards": len(shards),
+                "shards_loaded": sum(1 for shard in shards if shard.prompts is not None),
+            }
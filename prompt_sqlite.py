@@ -0,0 +1,287 @@
+import os
+import sqlite3
+from .prompt_store import DEFAULT_PROMPTS, IMPORT_STRATEGIES, PromptStore, free_prompt_name, import_counts, write_atomic
+from .prompt_metrics import METRICS
+from . import prompt_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    text TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (category, name)
+);
+CREATE INDEX IF NOT EXISTS prompts_by_name ON prompts (name);
+CREATE INDEX IF NOT EXISTS prompts_by_category ON prompts (category);
+"""
+
+
+class SqlitePromptStore(PromptStore):
+    """Prompt store backed by an SQLite database next to prompts.json.
+
+    Lookups are indexed queries, so listing a category or fetching one text no
+    longer needs the whole library in memory. A single connection in WAL mode is
+    shared by every request handler and the node execution thread, guarded by
+    the store lock. Edits run inside an open transaction that flush() commits,
+    which keeps the coalescing of commit() from the JSON store.
+
+    Categories and prompts keep their insertion order (category id and prompt
+    rowid), matching the order of keys in prompts.json.
+    """
+
+    def __init__(self, prompts_file):
+        super().__init__(prompts_file)
+        self.db_file = os.path.join(os.path.dirname(prompts_file), "prompts.sqlite3")
+        self._conn = None
+        self._data_version = None
+
+    def _connect(self):
+        """Open the shared connection and create the schema on first use"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level="DEFERRED")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _is_dirty(self):
+        return self._conn is not None and self._conn.in_transaction
+
+    def _check_external_changes(self, conn):
+        """Bump the version when another connection committed since our last look"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            first_check = self._data_version is None
+            self._data_version = data_version
+            if first_check:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.version += 1
+                self._notify(("reload",))
+        else:
+            self.hits += 1
+
+    def _query(self, sql, params=()):
+        with self._locked():
+            conn = self._connect()
+            self._check_external_changes(conn)
+            with METRICS.timer("sqlite_query"):
+                return conn.execute(sql, params).fetchall()
+
+    def refresh(self):
+        with self._locked():
+            self._check_external_changes(self._connect())
+
+    def ensure_file(self):
+        """Create the database, seeding it from prompts.json (or the defaults) when empty"""
+        with self._locked():
+            try:
+                conn = self._connect()
+                if conn.execute("SELECT 1 FROM categories LIMIT 1").fetchone():
+                    return
+                if os.path.exists(self.prompts_file):
+                    self.import_json(self.prompts_file)
+                else:
+                    self.import_dict(DEFAULT_PROMPTS)
+            except Exception as e:
+                print(f"Error creating prompts.sqlite3: {e}")
+
+    def snapshot(self):
+        """Build the whole library as a prompts.json-style dict (not cached)"""
+        with self._locked():
+            prompts_db = {category: {} for category in self.categories()}
+            for category, name, text in self._query(
+                    "SELECT category, name, text FROM prompts ORDER BY rowid"):
+                prompts_db.setdefault(category, {})[name] = text
+            return prompts_db
+
+    def categories(self):
+        return [row[0] for row in self._query("SELECT name FROM categories ORDER BY id")]
+
+    def prompt_names(self, category):
+        return [row[0] for row in self._query(
+            "SELECT name FROM prompts WHERE category = ? ORDER BY rowid", (category,))]
+
+    def all_prompt_names(self):
+        return {row[0] for row in self._query("SELECT DISTINCT name FROM prompts")}
+
+    # Rows fetched per query while iterating, so the lock is never held for long
+    PAGE_SIZE = 500
+
+    def _iter_rows(self, sql, params, cursor):
+        """Keyset-paginate a query whose first column is the cursor (id or rowid)"""
+        cursor = cursor or 0
+        while True:
+            rows = self._query(sql, params + (cursor, self.PAGE_SIZE))
+            yield from rows
+            if len(rows) < self.PAGE_SIZE:
+                return
+            cursor = rows[-1][0]
+
+    def iter_categories(self, prefix="", cursor=None):
+        return self._iter_rows(
+            "SELECT id, name FROM categories WHERE substr(name, 1, ?) = ? AND id > ? "
+            "ORDER BY id LIMIT ?", (len(prefix), prefix), cursor)
+
+    def iter_prompt_names(self, category, prefix="", cursor=None):
+        return self._iter_rows(
+            "SELECT rowid, name FROM prompts WHERE category = ? AND substr(name, 1, ?) = ? "
+            "AND rowid > ? ORDER BY rowid LIMIT ?", (category, len(prefix), prefix), cursor)
+
+    def get_text(self, category, prompt_name):
+        rows = self._query(
+            "SELECT text FROM prompts WHERE category = ? AND name = ?", (category, prompt_name))
+        return rows[0][0] if rows else ""
+
+    def get_texts(self, pairs):
+        with self._locked():
+            conn = self._connect()
+            self._check_external_changes(conn)
+            texts = []
+            for category, prompt_name in pairs:
+                row = conn.execute(
+                    "SELECT text FROM prompts WHERE category = ? AND name = ?",
+                    (category, prompt_name)).fetchone()
+                texts.append(row[0] if row else "")
+            return texts
+
+    def _upsert(self, conn, category, prompt_name, prompt_text):
+        """Insert or update one prompt inside the current transaction"""
+        cursor = conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
+        is_new_category = cursor.rowcount > 0
+        # ON CONFLICT keeps the rowid, so an edited prompt keeps its position
+        conn.execute(
+            "INSERT INTO prompts (category, name, text) VALUES (?, ?, ?) "
+            "ON CONFLICT (category, name) DO UPDATE SET text = excluded.text",
+            (category, prompt_name, prompt_text))
+        return is_new_category
+
+    def set_prompt(self, category, prompt_name, prompt_text):
+        """Store a prompt in the open transaction; flush() or commit() persists it.
+
+        Returns True if the category had to be created.
+        """
+        with self._locked():
+            conn = self._connect()
+            self._check_external_changes(conn)
+            is_new_category = self._upsert(conn, category, prompt_name, prompt_text)
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("set", category, prompt_name, prompt_text))
+            return is_new_category
+
+    def delete_prompt(self, category, prompt_name):
+        """Delete a prompt in the open transaction; returns False if there was none"""
+        with self._locked():
+            conn = self._connect()
+            self._check_external_changes(conn)
+            cursor = conn.execute(
+                "DELETE FROM prompts WHERE category = ? AND name = ?", (category, prompt_name))
+            if cursor.rowcount == 0:
+                return False
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("delete", category, prompt_name))
+            return True
+
+    def import_prompts(self, records, on_conflict="overwrite"):
+        if on_conflict not in IMPORT_STRATEGIES:
+            raise ValueError(f"Unknown conflict strategy '{on_conflict}'")
+        counts = import_counts()
+        with self._locked():
+            conn = self._connect()
+            self._check_external_changes(conn)
+
+            def exists(category, prompt_name):
+                return conn.execute(
+                    "SELECT 1 FROM prompts WHERE category = ? AND name = ?", (category, prompt_name)).fetchone()
+
+            # A savepoint undoes a failed import without touching other pending edits;
+            # it sits inside the open transaction, so flush() still does the commit
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            conn.execute("SAVEPOINT import_prompts")
+            applied = False
+            try:
+                for category, prompt_name, prompt_text in records:
+                    if exists(category, prompt_name):
+                        if on_conflict == "skip":
+                            counts["skipped"] += 1
+                            continue
+                        if on_conflict == "rename":
+                            prompt_name = free_prompt_name(prompt_name, lambda name: exists(category, name))
+                            counts["renamed"] += 1
+                        else:
+                            counts["updated"] += 1
+                    else:
+                        counts["created"] += 1
+                    if self._upsert(conn, category, prompt_name, prompt_text):
+                        counts["categories_created"] += 1
+                    applied = True
+            except BaseException:
+                conn.execute("ROLLBACK TO import_prompts")
+                conn.execute("RELEASE import_prompts")
+                raise
+            conn.execute("RELEASE import_prompts")
+
+            if applied:
+                self._edit_seq += 1
+                self.version += 1
+                self._notify(("reload",))
+        return counts
+
+    def flush(self):
+        """Commit the open transaction, if there is one"""
+        with self._flush_lock:
+            with self._locked():
+                if not self._is_dirty():
+                    return
+                with METRICS.timer("sqlite_commit"):
+                    self._conn.commit()
+                self._flushed_seq = self._edit_seq
+                self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def import_dict(self, prompts_db):
+        """Load a prompts.json-style dict into the database in one transaction"""
+        with self._locked():
+            conn = self._connect()
+            with conn:
+                for category, category_prompts in prompts_db.items():
+                    if not isinstance(category_prompts, dict):
+                        continue
+                    conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
+                    for prompt_name, prompt_text in category_prompts.items():
+                        self._upsert(conn, category, prompt_name, prompt_text)
+            self._flushed_seq = self._edit_seq
+            self.version += 1
+            self._notify(("reload",))
+
+    def import_json(self, path):
+        """One-shot import of a prompts.json file"""
+        with open(path, 'rb') as f:
+            prompts_db = prompt_codec.loads(f.read())
+        if not isinstance(prompts_db, dict):
+            raise ValueError(f"{path} does not contain a JSON object")
+        self.import_dict(prompts_db)
+
+    def export_json(self, path=None):
+        """Write the database out in the prompts.json layout (defaults to prompts.json itself)"""
+        write_atomic(path or self.prompts_file, self._serialize(self.snapshot()))
+
+    def stats(self):
+        with self._locked():
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.version,
+                "pending_edits": self._edit_seq - self._flushed_seq,
+                "categories": self._connect().execute("SELECT COUNT(*) FROM categories").fetchone()[0],
+            }
@@ -1,6 +1,14 @@
 import os
-import json
-from .prompt_db import get_user_db_path, DEFAULT_PROMPTS
+import sys
+import random
+import hashlib
+import itertools
+from aiohttp import web
+import server
+from .prompt_db import get_user_db_path, get_prompt_store
+from .prompt_store import get_store, run_blocking
+from .prompt_template import TemplateError, get_template_engine, parse_variables, read_variables
+from .prompt_metrics import timed_route
 
 class AnyType(str):
   """A special class that is always equal in not equal comparisons. Credit to pythongosssss"""
@@ -28,6 +36,26 @@ class FlexibleOptionalInputType(dict):
 
 any_type = AnyType("*")
 
+def parse_prompt_entries(inputs):
+    """Return the enabled (category, name) pairs from prompt_N_* node inputs, in entry order"""
+    # Find all prompt entries by scanning for keys like prompt_N_category
+    prompt_indices = set()
+    for key in inputs.keys():
+        if key.startswith('prompt_') and key.endswith('_category'):
+            try:
+                idx = int(key.split('_')[1])
+                prompt_indices.add(idx)
+            except Exception:
+                continue
+    pairs = []
+    for idx in sorted(prompt_indices):
+        cat = inputs.get(f'prompt_{idx}_category', None)
+        name = inputs.get(f'prompt_{idx}_name', None)
+        enabled = inputs.get(f'prompt_{idx}_enabled', True)
+        if enabled and cat and name:
+            pairs.append((cat, name))
+    return pairs
+
 class PromptStack:
     """A node that allows stacking multiple prompts from the database into a single output"""
     
@@ -38,13 +66,7 @@ class PromptStack:
     
     def ensure_prompts_file(self):
         """Create prompts.json file if it doesn't exist"""
-        if not os.path.exists(self.prompts_file):
-            try:
-                os.makedirs(os.path.dirname(self.prompts_file), exist_ok=True)
-                with open(self.prompts_file, 'w', encoding='utf-8') as f:
-                    json.dump(DEFAULT_PROMPTS, f, indent=2, ensure_ascii=False)
-            except Exception as e:
-                print(f"Error creating prompts.json: {e}")
+        get_store(self.prompts_file).ensure_file()
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -53,28 +75,11 @@ class PromptStack:
         prompt_names = []
         
         try:
-            user_db_path = get_user_db_path()
-            prompts_file = os.path.join(user_db_path, "prompts.json")
-            
-            if not os.path.exists(prompts_file):
-                try:
-                    os.makedirs(os.path.dirname(prompts_file), exist_ok=True)
-                    with open(prompts_file, 'w', encoding='utf-8') as f:
-                        json.dump(DEFAULT_PROMPTS, f, indent=2, ensure_ascii=False)
-                except Exception as e:
-                    print(f"Error creating prompts.json: {e}")
-            
-            if os.path.exists(prompts_file):
-                with open(prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-                    categories = list(prompts_db.keys())
-                    
-                    # Get ALL prompt names from ALL categories for validation
-                    prompt_names_set = set()
-                    for category in categories:
-                        category_prompts = prompts_db.get(category, {})
-                        prompt_names_set.update(category_prompts.keys())
-                    prompt_names = list(prompt_names_set)
+            # Get ALL prompt names from ALL categories for validation; the lists are
+            # only rebuilt when the library changed since the last call
+            store = get_prompt_store()
+            categories, prompt_names = store.memoize(
+                "PromptStack.options", lambda: (store.categories(), list(store.all_prompt_names())))
                         
         except Exception as e:
             print(f"Error loading categories for PromptStack INPUT_TYPES: {e}")
@@ -94,6 +99,9 @@ class PromptStack:
                 "prompt_1_category": (categories, {"default": categories[0]}),
                 "prompt_1_name": (prompt_names, {"default": prompt_names[0] if prompt_names else ""}),
                 "prompt_1_enabled": ("BOOLEAN", {"default": True}),
+                # "name = value" lines for {{name}} in the stacked prompts; an input
+                # socket rather than a widget, so saved widget values keep their order
+                "variables": ("STRING", {"forceInput": True, "multiline": True}),
             }),
             "hidden": {},
         }
@@ -103,38 +111,253 @@ class PromptStack:
     FUNCTION = "stack_prompts"
     CATEGORY = "text"
     
-    def stack_prompts(self, separator=", ", preview_text="", **kwargs):
-        stacked_prompts = []
-        prompts_db = {}
-        if os.path.exists(self.prompts_file):
-            try:
-                with open(self.prompts_file, 'r', encoding='utf-8') as f:
-                    prompts_db = json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                pass
-        else:
-            pass
-
-        # Find all prompt entries by scanning for keys like prompt_N_category
-        prompt_indices = set()
-        for key in kwargs.keys():
-            if key.startswith('prompt_') and key.endswith('_category'):
-                try:
-                    idx = int(key.split('_')[1])
-                    prompt_indices.add(idx)
-                except Exception:
-                    continue
-        for idx in sorted(prompt_indices):
-            cat = kwargs.get(f'prompt_{idx}_category', None)
-            name = kwargs.get(f'prompt_{idx}_name', None)
-            enabled = kwargs.get(f'prompt_{idx}_enabled', True)
-            if enabled and cat and name:
-                prompt_text = prompts_db.get(cat, {}).get(name, "")
-                if prompt_text:
-                    stacked_prompts.append(prompt_text)
-                else:
-                    pass
-            else:
-                pass
-        result = separator.join(stacked_prompts)
+    @classmethod
+    def IS_CHANGED(cls, separator=", ", preview_text="", variables="", **kwargs):
+        """Hash the stacked text, so the node re-runs when a referenced or included prompt is edited"""
+        engine = get_template_engine(get_prompt_store())
+        try:
+            stacked_prompts = engine.render_stack(parse_prompt_entries(kwargs), separator, parse_variables(variables))
+        except TemplateError as e:
+            # Let the node run and report the error
+            stacked_prompts = str(e)
+        return hashlib.sha256(stacked_prompts.encode('utf-8')).hexdigest()
+    
+    def stack_prompts(self, separator=", ", preview_text="", variables="", **kwargs):
+        engine = get_template_engine(get_store(self.prompts_file))
+        result = engine.render_stack(parse_prompt_entries(kwargs), separator, parse_variables(variables))
         return (result,)
+
+
+# Entry name that selects every prompt in its category, in sweep mode
+SWEEP_ALL = "*"
+
+SWEEP_MODES = ("product", "zip")
+
+# Largest sweep the node will output without an explicit limit or sample
+MAX_SWEEP_PROMPTS = 10000
+
+# Combinations shown by the preview route in sweep mode
+PREVIEW_SWEEP_PROMPTS = 20
+
+
+def sweep_axes(store, pairs):
+    """Expand each entry's name into the (category, name) pairs it selects.
+
+    A name is a single prompt, "*" for the whole category, or several names
+    separated by "|" (a list also works when the workflow is sent through the API).
+    A name that exists as is, "|" included, is never split.
+    """
+    axes = []
+    for category, name in pairs:
+        if isinstance(name, (list, tuple)):
+            names = [str(item) for item in name]
+        elif name == SWEEP_ALL:
+            names = store.prompt_names(category)
+        elif "|" in name and not store.get_text(category, name):
+            names = [item.strip() for item in name.split("|") if item.strip()]
+        else:
+            names = [name]
+        axes.append([(category, item) for item in names])
+    return axes
+
+
+def sweep_size(axes, mode):
+    if not axes:
+        return 0
+    if mode == "zip":
+        return min(len(axis) for axis in axes)
+    size = 1
+    for axis in axes:
+        size *= len(axis)
+    return size
+
+
+def sweep_combinations(axes, mode="product", limit=0, sample=0, seed=0):
+    """Lazily yield the combinations of a sweep as tuples of (category, name) pairs.
+
+    product crosses every entry with every other; zip pairs them up by position
+    and stops at the shortest. sample picks that many combinations at random
+    (reproducibly for a seed), kept in sweep order; limit then keeps the first
+    limit. Only the yielded combinations are ever built, so huge products are fine.
+    """
+    if not axes:
+        return iter(())
+    if sample > 0:
+        size = sweep_size(axes, mode)
+        indices = sorted(sample_indices(size, sample, seed))
+        if mode == "zip":
+            combinations = (tuple(axis[index] for axis in axes) for index in indices)
+        else:
+            combinations = (product_at(axes, index) for index in indices)
+    elif mode == "zip":
+        combinations = zip(*axes)
+    else:
+        combinations = itertools.product(*axes)
+    return itertools.islice(combinations, limit) if limit > 0 else combinations
+
+
+def sample_indices(size, sample, seed):
+    """Pick min(sample, size) distinct indices below size, in O(sample) memory"""
+    rng = random.Random(seed)
+    if size <= sys.maxsize:
+        return rng.sample(range(size), min(sample, size))
+    # range() can't report a length this large, which sample() needs; with this
+    # many combinations, drawing until there are enough distinct ones is quick
+    indices = set()
+    while len(indices) < sample:
+        indices.add(rng.randrange(size))
+    return indices
+
+
+def product_at(axes, index):
+    """The index-th combination of itertools.product(*axes), without iterating to it"""
+    combination = []
+    for axis in reversed(axes):
+        index, position = divmod(index, len(axis))
+        combination.append(axis[position])
+    return tuple(reversed(combination))
+
+
+def sweep_count(axes, mode="product", limit=0, sample=0):
+    count = sweep_size(axes, mode)
+    if sample > 0:
+        count = min(count, sample)
+    if limit > 0:
+        count = min(count, limit)
+    return count
+
+
+def sweep_too_large(count):
+    return f"The sweep makes {count} prompts, more than {MAX_SWEEP_PROMPTS}; set limit or sample to run part of it"
+
+
+def render_sweep(store, entries, separator, mode, limit, sample, seed, variables):
+    """The prompts a sweep outputs; raises ValueError for more than MAX_SWEEP_PROMPTS"""
+    axes = sweep_axes(store, entries)
+    count = sweep_count(axes, mode, limit, sample)
+    if count > MAX_SWEEP_PROMPTS:
+        raise ValueError(sweep_too_large(count))
+
+    engine = get_template_engine(store)
+    variables = parse_variables(variables)
+    return [engine.render_stack(pairs, separator, variables)
+            for pairs in sweep_combinations(axes, mode, limit, sample, seed)]
+
+
+class PromptStackSweep(PromptStack):
+    """PromptStack that outputs every combination of its entries as a list of prompts.
+
+    An entry selects one prompt, a whole category ("*") or several prompts
+    ("a | b"). The node runs downstream nodes once per combination, so one
+    execution replaces a queue of near-identical graphs.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["required"].update({
+            "mode": (list(SWEEP_MODES), {"default": "product"}),
+            "limit": ("INT", {"default": 0, "min": 0, "max": 0xffffffff}),
+            "sample": ("INT", {"default": 0, "min": 0, "max": 0xffffffff}),
+            "sample_seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+        })
+        optional = input_types["optional"].data
+        prompt_names = [SWEEP_ALL] + list(optional["prompt_1_name"][0])
+        input_types["optional"] = FlexibleOptionalInputType(any_type, {
+            **optional,
+            "prompt_1_name": (prompt_names, {"default": SWEEP_ALL}),
+        })
+        return input_types
+
+    RETURN_NAMES = ("stacked_prompts",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "sweep_prompts"
+
+    @classmethod
+    def VALIDATE_INPUTS(cls, **kwargs):
+        """Entry names may be "*" or lists, which the option lists can't express"""
+        return True
+
+    @classmethod
+    def IS_CHANGED(cls, separator=", ", preview_text="", mode="product", limit=0, sample=0, sample_seed=0,
+                   variables="", **kwargs):
+        """Hash the rendered sweep, so edits to prompts it doesn't use don't re-run it"""
+        try:
+            prompts = render_sweep(get_prompt_store(), parse_prompt_entries(kwargs), separator, mode, limit, sample,
+                                   sample_seed, variables)
+        except (TemplateError, ValueError) as e:
+            # Let the node run and report the error
+            prompts = [str(e)]
+        return hashlib.sha256("\0".join(prompts).encode('utf-8')).hexdigest()
+
+    def sweep_prompts(self, separator=", ", preview_text="", mode="product", limit=0, sample=0, sample_seed=0,
+                      variables="", **kwargs):
+        return (render_sweep(get_store(self.prompts_file), parse_prompt_entries(kwargs), separator, mode, limit,
+                             sample, sample_seed, variables),)
+
+
+# API endpoint for previewing a stack exactly as the node would output it
+@server.PromptServer.instance.routes.post("/prompt_stack_preview")
+@timed_route
+async def preview_stack(request):
+    try:
+        data = await request.json()
+        separator = data.get("separator", ", ")
+        inputs = data.get("inputs", {})
+        # "name = value" lines, like the node input, or an object
+        variables = read_variables(data.get("variables", ""))
+        # Sweep settings ({"mode", "limit", "sample", "sample_seed"}) for the sweep node
+        sweep = data.get("sweep")
+        
+        if not isinstance(separator, str) or not isinstance(inputs, dict):
+            return web.json_response({"stacked_prompts": ""}, status=400)
+        
+        store = await run_blocking(get_prompt_store)
+        engine = get_template_engine(store)
+        if isinstance(sweep, dict):
+            return await preview_sweep(store, engine, inputs, separator, variables, sweep)
+        try:
+            stacked_prompts = await run_blocking(engine.render_stack, parse_prompt_entries(inputs), separator, variables)
+        except TemplateError as e:
+            return web.json_response({"stacked_prompts": "", "error": str(e)}, status=400)
+        
+        return web.json_response({"stacked_prompts": stacked_prompts})
+        
+    except Exception as e:
+        print(f"Error in preview_stack: {e}")
+        return web.json_response({"stacked_prompts": ""}, status=500)
+
+
+async def preview_sweep(store, engine, inputs, separator, variables, sweep):
+    """Preview the first combinations of a sweep, one per line, with the total count"""
+    mode = sweep.get("mode", "product")
+    if mode not in SWEEP_MODES:
+        return web.json_response({"stacked_prompts": "", "error": f"Unknown mode '{mode}'"}, status=400)
+    try:
+        limit = max(int(sweep.get("limit") or 0), 0)
+        sample = max(int(sweep.get("sample") or 0), 0)
+        seed = int(sweep.get("sample_seed") or 0)
+    except (TypeError, ValueError):
+        return web.json_response({"stacked_prompts": "", "error": "limit, sample and sample_seed must be integers"},
+                                 status=400)
+
+    def build():
+        axes = sweep_axes(store, parse_prompt_entries(inputs))
+        count = sweep_count(axes, mode, limit, sample)
+        # Refused like the node would, before any sampling work
+        if count > MAX_SWEEP_PROMPTS:
+            return None, count
+        combinations = sweep_combinations(axes, mode, limit, sample, seed)
+        shown = [engine.render_stack(pairs, separator, variables)
+                 for pairs in itertools.islice(combinations, PREVIEW_SWEEP_PROMPTS)]
+        return shown, count
+
+    try:
+        shown, count = await run_blocking(build)
+    except TemplateError as e:
+        return web.json_response({"stacked_prompts": "", "error": str(e)}, status=400)
+    if shown is None:
+        return web.json_response({"stacked_prompts": "", "count": count, "error": sweep_too_large(count)},
+                                 status=400)
+
+    return web.json_response({"stacked_prompts": "\n".join(shown), "count": count})
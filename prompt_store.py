@@ -0,0 +1,666 @@
+import os
+import time
+import asyncio
+import secrets
+import weakref
+import itertools
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .prompt_metrics import METRICS
+from . import prompt_codec
+
+# DRY: Define default prompts once at module level
+DEFAULT_PROMPTS = {
+    "poses": {
+        "posing with camera": "a person posing with a camera, professional photography pose, confident stance",
+        "casual sitting": "person sitting casually, relaxed posture, natural lighting",
+        "standing portrait": "person standing in portrait pose, direct eye contact, professional setting"
+    },
+    "styles": {
+        "cinematic": "cinematic lighting, dramatic shadows, film grain, professional cinematography",
+        "artistic": "artistic composition, creative lighting, expressive style, fine art photography",
+        "minimalist": "clean composition, minimal background, simple elegant style"
+    },
+    "quality": {
+        "high quality": "masterpiece, best quality, ultra detailed, 8k resolution, professional photography",
+        "artistic quality": "artistic masterpiece, fine art, museum quality, exceptional detail",
+        "photorealistic": "photorealistic, hyperrealistic, lifelike, professional photo quality"
+    }
+}
+
+
+def write_atomic(path, payload):
+    """Replace a file with new bytes so readers only ever see the old or the new contents"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".prompts-", suffix=".tmp")
+    try:
+        with METRICS.timer("file_write"), os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    METRICS.count("bytes_written", len(payload))
+    # Persist the rename itself; not every platform can open a directory
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+# What import_prompts() does with a prompt that already exists
+IMPORT_STRATEGIES = ("overwrite", "skip", "rename")
+
+
+def free_prompt_name(prompt_name, exists):
+    """Return the first of "name (2)", "name (3)", ... for which exists(name) is false"""
+    number = 2
+    while exists(f"{prompt_name} ({number})"):
+        number += 1
+    return f"{prompt_name} ({number})"
+
+
+def import_counts():
+    return dict.fromkeys(("created", "updated", "skipped", "renamed", "categories_created"), 0)
+
+
+class PromptStore:
+    """Process-wide in-memory copy of prompts.json, revalidated against the file's stat.
+
+    Readers never parse the file unless its (mtime, size, inode) changed since the
+    last load. The cached dict is replaced copy-on-write, so a snapshot handed out
+    to a reader is never mutated underneath it.
+
+    Edits are applied in memory first and persisted by flush(), or by commit()
+    from a request handler, which coalesces saves arriving within COMMIT_WINDOW
+    seconds into a single atomic rewrite of the file.
+    """
+
+    # Seconds to wait for further saves before writing the file
+    COMMIT_WINDOW = 0.05
+
+    # Derived values kept by memoize(), least recently used dropped first
+    MEMO_SIZE = 256
+
+    # Write prompts.json without indentation: smaller and faster, but harder to hand-edit
+    COMPACT_JSON = os.environ.get("PROMPT_DB_COMPACT_JSON", "").strip().lower() in ("1", "true", "yes")
+
+    def __init__(self, prompts_file):
+        self.prompts_file = prompts_file
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._data = {}
+        self._stat_key = None
+        # Edits in memory vs. edits known to be on disk
+        self._edit_seq = 0
+        self._flushed_seq = 0
+        # Edit records not yet on disk, as (op, category, prompt_name, prompt_text)
+        self._pending_records = []
+        # Coalescing state for commit(), only touched from the event loop
+        self._commit_lock = None
+        self._pending_commit = None
+        self._commit_task = None
+        self.hits = 0
+        self.misses = 0
+        # Bumped every time the in-memory contents change (reload or edit)
+        self.version = 0
+        # Distinguishes versions handed out before and after a restart
+        self.epoch = secrets.token_hex(4)
+        # Values derived from the library, see memoize()
+        self._memo = OrderedDict()
+        # Callbacks told about every change, see add_listener()
+        self._listeners = []
+
+    def _stat_file(self):
+        """Return a cheap identity for the file on disk, or None if it is missing"""
+        try:
+            st = os.stat(self.prompts_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def ensure_file(self):
+        """Create prompts.json with the default prompts if it doesn't exist"""
+        with self._locked():
+            if os.path.exists(self.prompts_file):
+                return
+            try:
+                write_atomic(self.prompts_file, self._serialize(DEFAULT_PROMPTS))
+            except Exception as e:
+                print(f"Error creating prompts.json: {e}")
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the store lock, recording how long it took to get it"""
+        start = time.perf_counter()
+        with self._lock:
+            METRICS.observe("store_lock_wait", time.perf_counter() - start)
+            yield
+
+    def locked(self):
+        """Hold the store lock across several calls, so they read and edit one consistent library"""
+        return self._locked()
+
+    def add_listener(self, callback):
+        """Call callback(event) after every change to the library.
+
+        event is ("set", category, prompt_name, prompt_text) for an edit,
+        ("delete", category, prompt_name) for a removal, or ("reload",) when the
+        contents were re-read because they changed elsewhere.
+        Callbacks run under the store lock, so they must be quick.
+        """
+        with self._locked():
+            self._listeners.append(callback)
+
+    def _notify(self, event):
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error in prompt store listener: {e}")
+
+    def _serialize(self, prompts_db):
+        """Encode the library in the on-disk prompts.json format"""
+        with METRICS.timer("json_serialize"):
+            return prompt_codec.dumps(prompts_db, pretty=not self.COMPACT_JSON)
+
+    def _read_file(self):
+        """Parse prompts.json, falling back to an empty library if it is unreadable"""
+        try:
+            with METRICS.timer("file_read"), open(self.prompts_file, 'rb') as f:
+                payload = f.read()
+            METRICS.count("bytes_read", len(payload))
+            with METRICS.timer("json_parse"):
+                prompts_db = prompt_codec.loads(payload)
+            if isinstance(prompts_db, dict):
+                return prompts_db
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading prompts.json: {e}")
+        return {}
+
+    def _write_changes(self, prompts_db, records):
+        """Persist the library; the JSON store always rewrites the whole file"""
+        write_atomic(self.prompts_file, self._serialize(prompts_db))
+
+    def _is_dirty(self):
+        return self._edit_seq != self._flushed_seq
+
+    def snapshot(self):
+        """Return the current prompts dict, reloading it only if the file changed.
+
+        The returned dict must be treated as read-only. While edits are waiting to
+        be written, the in-memory copy wins over whatever is on disk.
+        """
+        stat_key = self._stat_file()
+        with self._locked():
+            if self._is_dirty() or (stat_key is not None and stat_key == self._stat_key):
+                self.hits += 1
+                return self._data
+
+            self.misses += 1
+            self._data = self._read_file() if stat_key is not None else {}
+            self._stat_key = stat_key
+            self.version += 1
+            self._notify(("reload",))
+            return self._data
+
+    def refresh(self):
+        """Pick up changes made outside this process now, notifying listeners"""
+        self.snapshot()
+
+    def version_tag(self):
+        """Return an opaque tag that changes whenever the library does (an ETag)"""
+        self.refresh()
+        return f"{self.epoch}-{self.version}"
+
+    def memoize(self, key, build):
+        """Return build(), reusing the last result until the library version changes"""
+        self.refresh()
+        with self._locked():
+            version = self.version
+            cached = self._memo.get(key)
+            if cached is not None and cached[0] == version:
+                self._memo.move_to_end(key)
+                METRICS.count("memo_hits")
+                return cached[1]
+        METRICS.count("memo_misses")
+        value = build()
+        with self._locked():
+            # Don't cache a value that may already be stale
+            if self.version == version:
+                self._memo[key] = (version, value)
+                self._memo.move_to_end(key)
+                if len(self._memo) > self.MEMO_SIZE:
+                    self._memo.popitem(last=False)
+        return value
+
+    def categories(self):
+        """List category names in file order"""
+        return list(self.snapshot().keys())
+
+    def prompt_names(self, category):
+        """List prompt names in a category, empty if the category is unknown"""
+        category_prompts = self.snapshot().get(category, {})
+        return list(category_prompts.keys()) if isinstance(category_prompts, dict) else []
+
+    def all_prompt_names(self):
+        """Return the set of prompt names used in any category"""
+        all_prompt_names = set()
+        for category_prompts in self.snapshot().values():
+            if isinstance(category_prompts, dict):
+                all_prompt_names.update(category_prompts.keys())
+        return all_prompt_names
+
+    def _iter_keys(self, keys, prefix, cursor):
+        """Yield (cursor, key) for keys after a position cursor that start with prefix"""
+        start = cursor or 0
+        for position, key in enumerate(itertools.islice(keys, start, None), start + 1):
+            if key.startswith(prefix):
+                yield position, key
+
+    def iter_categories(self, prefix="", cursor=None):
+        """Lazily yield (cursor, category) in file order, resuming after a cursor.
+
+        A cursor is an opaque value handed back with each item; passing it in
+        again continues the listing right after that item.
+        """
+        return self._iter_keys(iter(self.snapshot()), prefix, cursor)
+
+    def iter_prompt_names(self, category, prefix="", cursor=None):
+        """Lazily yield (cursor, prompt_name) for a category, like iter_categories()"""
+        category_prompts = self.snapshot().get(category, {})
+        if not isinstance(category_prompts, dict):
+            return iter(())
+        return self._iter_keys(iter(category_prompts), prefix, cursor)
+
+    def get_text(self, category, prompt_name):
+        """Return a prompt's text, empty if it doesn't exist"""
+        category_prompts = self.snapshot().get(category, {})
+        if not isinstance(category_prompts, dict):
+            return ""
+        return category_prompts.get(prompt_name, "")
+
+    def get_texts(self, pairs):
+        """Return the texts for a sequence of (category, prompt_name) pairs from one snapshot"""
+        prompts_db = self.snapshot()
+        texts = []
+        for category, prompt_name in pairs:
+            category_prompts = prompts_db.get(category, {})
+            texts.append(category_prompts.get(prompt_name, "") if isinstance(category_prompts, dict) else "")
+        return texts
+
+    def set_prompt(self, category, prompt_name, prompt_text):
+        """Store a prompt in memory; flush() or commit() persists it.
+
+        Returns True if the category had to be created.
+        """
+        with self._locked():
+            current = self.snapshot()
+            is_new_category = category not in current
+
+            # Copy-on-write so snapshots held by readers stay consistent
+            prompts_db = dict(current)
+            category_prompts = dict(current.get(category) or {})
+            category_prompts[prompt_name] = prompt_text
+            prompts_db[category] = category_prompts
+
+            self._data = prompts_db
+            self._pending_records.append(("set", category, prompt_name, prompt_text))
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("set", category, prompt_name, prompt_text))
+            return is_new_category
+
+    def delete_prompt(self, category, prompt_name):
+        """Remove a prompt in memory; flush() or commit() persists it.
+
+        Returns False if there was no such prompt. The category is kept, even if
+        it is left empty.
+        """
+        with self._locked():
+            current = self.snapshot()
+            category_prompts = current.get(category)
+            if not isinstance(category_prompts, dict) or prompt_name not in category_prompts:
+                return False
+
+            prompts_db = dict(current)
+            category_prompts = dict(category_prompts)
+            del category_prompts[prompt_name]
+            prompts_db[category] = category_prompts
+
+            self._data = prompts_db
+            self._pending_records.append(("delete", category, prompt_name, None))
+            self._edit_seq += 1
+            self.version += 1
+            self._notify(("delete", category, prompt_name))
+            return True
+
+    def check_delete(self, category, prompt_name):
+        """Raise ValueError if delete_prompt() would refuse to remove this prompt.
+
+        Lets a caller check several deletions before making any of them.
+        """
+
+    def replace_prompt(self, category, prompt_name, prompt_text):
+        """set_prompt() that also reads the text it replaces under the same lock.
+
+        Returns (previous_text, is_new_category); previous_text is empty for a new prompt.
+        """
+        with self._locked():
+            previous = self.get_text(category, prompt_name)
+            return previous, self.set_prompt(category, prompt_name, prompt_text)
+
+    def pop_prompt(self, category, prompt_name):
+        """delete_prompt() that returns the removed text, or None if there was no such prompt"""
+        with self._locked():
+            previous = self.get_text(category, prompt_name)
+            return previous if self.delete_prompt(category, prompt_name) else None
+
+    def import_prompts(self, records, on_conflict="overwrite"):
+        """Apply many (category, prompt_name, prompt_text) records as a single edit.
+
+        on_conflict decides what happens when a prompt already exists: "overwrite"
+        replaces its text, "skip" keeps it, and "rename" stores the new one as
+        "name (2)", "name (3)", ... Listeners get a single ("reload",) event, and
+        the next flush() or commit() writes everything at once. Returns counts of
+        created, updated, skipped and renamed prompts and of new categories.
+        """
+        if on_conflict not in IMPORT_STRATEGIES:
+            raise ValueError(f"Unknown conflict strategy '{on_conflict}'")
+        counts = import_counts()
+        with self._locked():
+            current = self.snapshot()
+
+            # Copy-on-write, copying each touched category only once
+            prompts_db = dict(current)
+            copied = set()
+            applied = []
+            for category, prompt_name, prompt_text in records:
+                if category not in copied:
+                    if category not in prompts_db:
+                        counts["categories_created"] += 1
+                    existing = prompts_db.get(category)
+                    prompts_db[category] = dict(existing) if isinstance(existing, dict) else {}
+                    copied.add(category)
+                category_prompts = prompts_db[category]
+
+                if prompt_name in category_prompts:
+                    if on_conflict == "skip":
+                        counts["skipped"] += 1
+                        continue
+                    if on_conflict == "rename":
+                        prompt_name = free_prompt_name(prompt_name, category_prompts.__contains__)
+                        counts["renamed"] += 1
+                    else:
+                        counts["updated"] += 1
+                else:
+                    counts["created"] += 1
+                category_prompts[prompt_name] = prompt_text
+                applied.append(("set", category, prompt_name, prompt_text))
+
+            if applied:
+                self._data = prompts_db
+                self._pending_records.extend(applied)
+                self._edit_seq += 1
+                self.version += 1
+                self._notify(("reload",))
+        return counts
+
+    def flush(self):
+        """Atomically write all pending edits to disk, if there are any.
+
+        If the write fails the edits stay pending, so the next flush retries them.
+        """
+        with self._flush_lock:
+            with self._locked():
+                if not self._is_dirty():
+                    return
+                seq = self._edit_seq
+                prompts_db = self._data
+                records, self._pending_records = self._pending_records, []
+
+            # Serialize outside the data lock; the snapshot is never mutated
+            try:
+                self._write_changes(prompts_db, records)
+            except BaseException:
+                with self._locked():
+                    self._pending_records[:0] = records
+                raise
+
+            with self._locked():
+                self._flushed_seq = seq
+                self._stat_key = self._stat_file()
+
+    async def commit(self):
+        """Wait until every edit made so far is on disk.
+
+        Calls arriving within COMMIT_WINDOW of each other share a single write, and
+        an asyncio lock keeps flushes from overlapping.
+        """
+        if self._commit_lock is None:
+            self._commit_lock = asyncio.Lock()
+        if self._pending_commit is None:
+            loop = asyncio.get_running_loop()
+            self._pending_commit = loop.create_future()
+            self._commit_task = loop.create_task(self._flush_pending())
+        await asyncio.shield(self._pending_commit)
+
+    async def _flush_pending(self):
+        await asyncio.sleep(self.COMMIT_WINDOW)
+        async with self._commit_lock:
+            # Saves arriving from now on wait for the next write
+            future, self._pending_commit = self._pending_commit, None
+            try:
+                await run_blocking(self.flush)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+    def stats(self):
+        """Cache counters for diagnostics"""
+        with self._locked():
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.version,
+                "pending_edits": self._edit_seq - self._flushed_seq,
+                "categories": len(self._data),
+            }
+
+
+class WalPromptStore(PromptStore):
+    """Prompt store that appends edits to a JSON-lines log instead of rewriting prompts.json.
+
+    Each flush appends one small record per edit to prompts.wal.jsonl, so a save
+    costs the same no matter how large the library is. Loading reads prompts.json
+    and replays the log over it. Once the log grows past WAL_MAX_BYTES it is
+    compacted: the full library is written to prompts.json (still the normal
+    export format) and the log is emptied. Replaying a log over a snapshot that
+    already contains it is harmless, so a crash between the two steps is safe.
+    """
+
+    WAL_MAX_BYTES = int(os.environ.get("PROMPT_DB_WAL_MAX_BYTES", 4 * 1024 * 1024))
+
+    def __init__(self, prompts_file):
+        super().__init__(prompts_file)
+        self.wal_file = os.path.join(os.path.dirname(prompts_file), "prompts.wal.jsonl")
+
+    def _stat_file(self):
+        snapshot_key = super()._stat_file()
+        if snapshot_key is None:
+            return None
+        try:
+            st = os.stat(self.wal_file)
+            return snapshot_key + (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return snapshot_key
+
+    def _read_file(self):
+        prompts_db = super()._read_file()
+        try:
+            with METRICS.timer("file_read"), open(self.wal_file, 'rb') as f:
+                lines = f.readlines()
+            METRICS.count("bytes_read", sum(len(line) for line in lines))
+        except FileNotFoundError:
+            return prompts_db
+        except Exception as e:
+            print(f"Error loading prompts.wal.jsonl: {e}")
+            return prompts_db
+
+        for line_number, line in enumerate(lines, 1):
+            try:
+                record = prompt_codec.loads(line)
+            except ValueError:
+                # A torn final line is what a crash mid-append leaves behind
+                if line_number != len(lines):
+                    print(f"Skipping corrupt prompts.wal.jsonl record on line {line_number}")
+                continue
+            if record.get("op") == "set":
+                category_prompts = prompts_db.setdefault(record["category"], {})
+                if isinstance(category_prompts, dict):
+                    category_prompts[record["name"]] = record["text"]
+            elif record.get("op") == "delete":
+                category_prompts = prompts_db.get(record["category"])
+                if isinstance(category_prompts, dict):
+                    category_prompts.pop(record["name"], None)
+        return prompts_db
+
+    def _write_changes(self, prompts_db, records):
+        payload = b"".join(
+            prompt_codec.dumps({"op": op, "category": category, "name": name, "text": text}) + b"\n"
+            for op, category, name, text in records
+        )
+        with METRICS.timer("wal_append"), open(self.wal_file, 'a+b') as f:
+            # After a crash mid-append the log can end in a torn line; start on a
+            # new line so the first record isn't joined onto it and lost
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    payload = b"\n" + payload
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            wal_size = f.tell()
+        METRICS.count("bytes_written", len(payload))
+
+        if wal_size > self.WAL_MAX_BYTES:
+            self._compact(prompts_db)
+
+    def _compact(self, prompts_db):
+        """Fold the log into prompts.json and start a new, empty log"""
+        write_atomic(self.prompts_file, self._serialize(prompts_db))
+        write_atomic(self.wal_file, b"")
+
+    def compact(self):
+        """Fold the log into prompts.json now, including any pending edits"""
+        with self._flush_lock:
+            with self._locked():
+                seq = self._edit_seq
+                prompts_db = self.snapshot()
+                records, self._pending_records = self._pending_records, []
+            try:
+                self._compact(prompts_db)
+            except BaseException:
+                with self._locked():
+                    self._pending_records[:0] = records
+                raise
+            with self._locked():
+                self._flushed_seq = seq
+                self._stat_key = self._stat_file()
+
+
+# Threads for blocking store work (file I/O, JSON, SQLite), so request handlers
+# never stall ComfyUI's event loop
+STORE_WORKERS = max(int(os.environ.get("PROMPT_DB_WORKERS", 4)), 1)
+
+# Calls allowed in flight per worker before callers wait on the event loop
+STORE_QUEUE_DEPTH = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+_executor_slots = weakref.WeakKeyDictionary()
+
+
+def get_executor():
+    """Return the shared, bounded thread pool for blocking store work"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=STORE_WORKERS, thread_name_prefix="prompt-db")
+        return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking store work on the prompt DB thread pool and await its result.
+
+    At most STORE_WORKERS * STORE_QUEUE_DEPTH calls are queued at once; further
+    callers wait on the event loop instead of piling up in the pool.
+    """
+    loop = asyncio.get_running_loop()
+    slots = _executor_slots.get(loop)
+    if slots is None:
+        slots = _executor_slots[loop] = asyncio.Semaphore(STORE_WORKERS * STORE_QUEUE_DEPTH)
+    submitted = time.perf_counter()
+
+    def call():
+        METRICS.observe("executor_wait", time.perf_counter() - submitted)
+        return func(*args, **kwargs)
+
+    async with slots:
+        return await loop.run_in_executor(get_executor(), call)
+
+
+STORE_BACKENDS = {
+    "json": PromptStore,
+    "wal": WalPromptStore,
+}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(prompts_file):
+    """Return the shared store for a prompts file, creating it on first use.
+
+    The storage backend is chosen with the PROMPT_DB_BACKEND environment variable
+    (json, wal, sqlite or sharded, default json).
+    """
+    prompts_file = os.path.abspath(prompts_file)
+    with _stores_lock:
+        store = _stores.get(prompts_file)
+        if store is None:
+            backend = os.environ.get("PROMPT_DB_BACKEND", "json").strip().lower()
+            if backend == "sqlite":
+                # Imported lazily so the sqlite3 module is only loaded when used
+                from .prompt_sqlite import SqlitePromptStore
+                store_class = SqlitePromptStore
+            elif backend == "sharded":
+                from .prompt_shards import ShardedPromptStore
+                store_class = ShardedPromptStore
+            elif backend in STORE_BACKENDS:
+                store_class = STORE_BACKENDS[backend]
+            else:
+                print(f"Unknown PROMPT_DB_BACKEND '{backend}', using json")
+                store_class = PromptStore
+            store = store_class(prompts_file)
+            _stores[prompts_file] = store
+        return store
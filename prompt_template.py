@@ -0,0 +1,195 @@
+import re
+import threading
+import functools
+from collections import defaultdict
+from .prompt_metrics import METRICS
+
+TAG_RE = re.compile(r"\{\{(.*?)\}\}", re.DOTALL)
+VARIABLE_RE = re.compile(r"^\w[\w -]*$", re.UNICODE)
+
+# Includes nested deeper than this are reported as an error
+MAX_INCLUDE_DEPTH = 32
+
+
+class TemplateError(ValueError):
+    """A prompt template can't be rendered: an include cycle or nesting too deep"""
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(text):
+    """Parse a prompt into a tuple of parts, cached per distinct text.
+
+    A part is a literal string, ("include", ref) for {{category/prompt name}},
+    or ("var", name, default) for {{name}} and {{name|default}}. Tags that are
+    neither are kept as literal text.
+    """
+    if "{{" not in text:
+        return (text,)
+    METRICS.count("template_compiles")
+    parts = []
+    position = 0
+    for match in TAG_RE.finditer(text):
+        inner = match.group(1).strip()
+        if "/" in inner:
+            part = ("include", inner)
+        else:
+            name, _, default = inner.partition("|")
+            name = name.strip()
+            if not VARIABLE_RE.match(name):
+                continue
+            part = ("var", name, default.strip())
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        parts.append(part)
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return tuple(parts)
+
+
+def parse_variables(text):
+    """Parse "name = value" lines into a dict; blank lines and # comments are skipped"""
+    variables = {}
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        name, _, value = line.partition("=")
+        variables[name.strip()] = value.strip()
+    return variables
+
+
+def read_variables(value):
+    """Variables sent to a route, as "name = value" lines like the node input or as an object"""
+    if isinstance(value, dict):
+        return {str(name): str(variable) for name, variable in value.items()}
+    return parse_variables(value if isinstance(value, str) else "")
+
+
+class TemplateEngine:
+    """Renders prompt templates from a store, caching expanded includes.
+
+    Each prompt is flattened once: its includes are replaced, recursively, by the
+    parts of the included prompts, leaving only text and variables, so rendering
+    is a single join. A flattened prompt remembers every prompt it was built
+    from; an edit to one of those (reported by the store's listener hook) drops
+    just the entries that depend on it, and a reload drops everything.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._flat = {}                         # (category, name) -> (flattened parts, dependencies)
+        self._dependents = defaultdict(set)     # (category, name) -> keys whose parts used it
+        # Bumped on every invalidation, so a result built from older texts isn't cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        store.add_listener(self._on_store_event)
+
+    def _on_store_event(self, event):
+        with self._lock:
+            self._generation += 1
+            if event[0] in ("set", "delete"):
+                for key in self._dependents.pop((event[1], event[2]), ()):
+                    self._flat.pop(key, None)
+            else:
+                self._flat.clear()
+                self._dependents.clear()
+
+    def _resolve(self, ref):
+        """Split an include reference into (category, name) candidates.
+
+        Category and prompt names may themselves contain "/", so every split is a
+        candidate; the first one naming a non-empty prompt is used.
+        """
+        candidates = []
+        position = ref.find("/")
+        while position >= 0:
+            candidates.append((ref[:position].strip(), ref[position + 1:].strip()))
+            position = ref.find("/", position + 1)
+        if len(candidates) > 1:
+            texts = self.store.get_texts(candidates)
+            for candidate, text in zip(candidates, texts):
+                if text:
+                    return candidate, candidates
+        return candidates[0], candidates
+
+    def _flatten(self, key, stack=()):
+        """Return (parts, dependencies) for a prompt, building and caching it if needed"""
+        with self._lock:
+            flattened = self._flat.get(key)
+            if flattened is not None:
+                self.hits += 1
+                return flattened
+            self.misses += 1
+            generation = self._generation
+
+        if key in stack:
+            cycle = [f"{category}/{name}" for category, name in stack[stack.index(key):] + (key,)]
+            raise TemplateError(f"Include cycle: {' -> '.join(cycle)}")
+        if len(stack) >= MAX_INCLUDE_DEPTH:
+            raise TemplateError(f"Includes nested more than {MAX_INCLUDE_DEPTH} deep at {key[0]}/{key[1]}")
+
+        dependencies = {key}
+        parts = []
+        for part in compile_template(self.store.get_text(*key)):
+            if isinstance(part, tuple) and part[0] == "include":
+                included, candidates = self._resolve(part[1])
+                included_parts, included_dependencies = self._flatten(included, stack + (key,))
+                parts.extend(included_parts)
+                dependencies.update(candidates)
+                dependencies.update(included_dependencies)
+            elif isinstance(part, str) and parts and isinstance(parts[-1], str):
+                parts[-1] += part
+            else:
+                parts.append(part)
+        flattened = (tuple(parts), frozenset(dependencies))
+
+        with self._lock:
+            if generation == self._generation:
+                self._flat[key] = flattened
+                for dependency in dependencies:
+                    self._dependents[dependency].add(key)
+        return flattened
+
+    def render(self, category, prompt_name, variables=None):
+        """Return a prompt's text with includes expanded and variables substituted.
+
+        A variable that isn't given uses its default, or renders empty.
+        """
+        variables = variables or {}
+        return "".join(
+            part if isinstance(part, str) else variables.get(part[1], part[2])
+            for part in self._flatten((category, prompt_name))[0])
+
+    def render_stack(self, pairs, separator=", ", variables=None):
+        """Render (category, prompt_name) pairs and join the non-empty results.
+
+        This is the one stacking implementation, used by the Prompt Stack nodes
+        and every route that returns stacked prompts.
+        """
+        with METRICS.timer("template_render"):
+            texts = (self.render(category, prompt_name, variables) for category, prompt_name in pairs)
+            return separator.join(text for text in texts if text)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "flattened": len(self._flat),
+            }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_template_engine(store):
+    """Return the template engine that follows a store, creating it on first use"""
+    with _engines_lock:
+        engine = _engines.get(id(store))
+        if engine is None:
+            engine = _engines[id(store)] = TemplateEngine(store)
+        return engine
@@ -0,0 +1,73 @@
+"""Tests for the append-only log storage mode (WalPromptStore).
+
+The package is loaded against the benchmark's stub ComfyUI modules, so these
+run without a ComfyUI install:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# The stubs go on the path up front: pytest also imports the package itself,
+# as the directory holding these tests
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+sys.path[:0] = [BENCH_DIR, os.path.join(BENCH_DIR, "stubs")]
+
+from bench_prompt_db import PACKAGE_NAME, load_package
+
+
+class WalPromptStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.base_path = tempfile.mkdtemp(prefix="prompt-db-test-")
+        load_package(cls.base_path)
+        cls.prompt_store = sys.modules[f"{PACKAGE_NAME}.prompt_store"]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.base_path, ignore_errors=True)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=self.base_path)
+        self.prompts_file = os.path.join(self.directory, "prompts.json")
+
+    def open_store(self):
+        store = self.prompt_store.WalPromptStore(self.prompts_file)
+        store.ensure_file()
+        return store
+
+    def test_edits_survive_reopening(self):
+        store = self.open_store()
+        store.set_prompt("poses", "a", "first")
+        store.flush()
+        store.delete_prompt("poses", "casual sitting")
+        store.flush()
+
+        store = self.open_store()
+        self.assertEqual(store.get_text("poses", "a"), "first")
+        self.assertEqual(store.get_text("poses", "casual sitting"), "")
+
+    def test_append_after_torn_line(self):
+        store = self.open_store()
+        store.set_prompt("poses", "a", "first")
+        store.flush()
+        # What a crash part way through an append leaves at the end of the log
+        with open(store.wal_file, 'ab') as f:
+            f.write(b'{"op": "set", "category": "poses", "na')
+
+        store = self.open_store()
+        self.assertEqual(store.get_text("poses", "a"), "first")
+        store.set_prompt("poses", "b", "second")
+        store.flush()
+
+        store = self.open_store()
+        self.assertEqual(store.get_text("poses", "a"), "first")
+        self.assertEqual(store.get_text("poses", "b"), "second")
+
+
+if __name__ == "__main__":
+    unittest.main()
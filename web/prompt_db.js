@@ -1,5 +1,6 @@
 import { app } from "../../scripts/app.js";
 import { api } from "../../scripts/api.js";
+import { fetchListing } from "./prompt_db_listing.js";
 
 // Extension for Prompt DB
 app.registerExtension({
@@ -21,59 +22,53 @@ app.registerExtension({
                 if (categoryWidget && promptNameWidget && promptTextWidget) {
                     
                     // Function to load prompts for a category
-                    const loadPrompts = async (category, preserveCurrentSelection = false, desiredPromptName = null) => {
+                    // keepEdits leaves the text alone if the user has unsaved edits
+                    const loadPrompts = async (category, preserveCurrentSelection = false, desiredPromptName = null, keepEdits = false) => {
                         try {
-                            const response = await api.fetchApi("/prompt_db_prompts", {
-                                method: "POST",
-                                headers: {
-                                    "Content-Type": "application/json",
-                                },
-                                body: JSON.stringify({
-                                    category: category
-                                })
+                            const data = await fetchListing("/prompt_db_prompts", {
+                                category: category
                             });
                             
-                            if (response.ok) {
-                                const data = await response.json();
+                            // Update the prompt name dropdown values
+                            if (data.prompts && data.prompts.length > 0) {
+                                promptNameWidget.options.values = [...data.prompts];
                                 
-                                // Update the prompt name dropdown values
-                                if (data.prompts && data.prompts.length > 0) {
-                                    promptNameWidget.options.values = data.prompts;
-                                    
-                                    // Use desiredPromptName if provided, otherwise preserve current selection
-                                    let targetPrompt = desiredPromptName ?? promptNameWidget.value;
-                                    if (!data.prompts.includes(targetPrompt)) {
-                                        targetPrompt = data.prompts[0];
-                                    }
-                                    promptNameWidget.value = targetPrompt;
-                                    
-                                    // If widget has an input element, update it
-                                    if (promptNameWidget.inputEl) {
-                                        promptNameWidget.inputEl.innerHTML = "";
-                                        data.prompts.forEach(prompt => {
-                                            const option = document.createElement("option");
-                                            option.value = prompt;
-                                            option.textContent = prompt;
-                                            promptNameWidget.inputEl.appendChild(option);
-                                        });
-                                        promptNameWidget.inputEl.value = promptNameWidget.value;
-                                    }
-                                    
-                                    // Load text for the current prompt (not necessarily the first one)
-                                    await loadPromptText(category, promptNameWidget.value);
-                                } else {
-                                    promptNameWidget.options.values = [];
-                                    promptNameWidget.value = "";
-                                    promptTextWidget.value = "";
+                                // Use desiredPromptName if provided, otherwise preserve current selection
+                                let targetPrompt = desiredPromptName ?? promptNameWidget.value;
+                                if (!data.prompts.includes(targetPrompt)) {
+                                    targetPrompt = data.prompts[0];
+                                }
+                                promptNameWidget.value = targetPrompt;
+                                
+                                // If widget has an input element, update it
+                                if (promptNameWidget.inputEl) {
+                                    promptNameWidget.inputEl.innerHTML = "";
+                                    data.prompts.forEach(prompt => {
+                                        const option = document.createElement("option");
+                                        option.value = prompt;
+                                        option.textContent = prompt;
+                                        promptNameWidget.inputEl.appendChild(option);
+                                    });
+                                    promptNameWidget.inputEl.value = promptNameWidget.value;
                                 }
+                                
+                                // Load text for the current prompt (not necessarily the first one)
+                                await loadPromptText(category, promptNameWidget.value, keepEdits);
+                            } else {
+                                promptNameWidget.options.values = [];
+                                promptNameWidget.value = "";
+                                promptTextWidget.value = "";
                             }
                         } catch (error) {
                             console.error("Error loading prompts:", error);
                         }
                     };
                     
+                    // Text as last loaded from the server, to tell whether the user has edited it
+                    let loadedText = null;
+                    
                     // Function to load prompt text
-                    const loadPromptText = async (category, promptName) => {
+                    const loadPromptText = async (category, promptName, keepEdits = false) => {
                         try {
                             const response = await api.fetchApi("/prompt_db_text", {
                                 method: "POST",
@@ -88,7 +83,9 @@ app.registerExtension({
                             
                             if (response.ok) {
                                 const data = await response.json();
+                                if (keepEdits && promptTextWidget.value !== loadedText) return;
                                 
+                                loadedText = data.prompt_text || "";
                                 promptTextWidget.value = data.prompt_text || "";
                                 
                                 // Update the text area DOM element if it exists
@@ -279,6 +276,8 @@ app.registerExtension({
                                 if (!data.success) {
                                     alert("Save failed: " + data.message);
                                 } else {
+                                    // The saved text is now the server's copy
+                                    loadedText = promptText;
                                     // Update dropdowns to reflect new values if needed
                                     if (!categoryWidget.options.values.includes(finalCategory)) {
                                         categoryWidget.options.values.push(finalCategory);
@@ -308,6 +307,95 @@ app.registerExtension({
                         }
                     });
                     
+                    // Search box for large libraries where scrolling the dropdowns is impractical
+                    const searchWidget = this.addWidget("text", "Search Prompts", "", null);
+                    if (searchWidget.inputEl) {
+                        searchWidget.inputEl.placeholder = "Search names and text...";
+                    }
+
+                    this.addWidget("button", "🔍 Search", "", async (value, canvas, node, pos, event) => {
+                        const query = searchWidget.value?.trim();
+                        if (!query) return;
+                        try {
+                            const response = await api.fetchApi("/prompt_db_search", {
+                                method: "POST",
+                                headers: { "Content-Type": "application/json" },
+                                body: JSON.stringify({ query: query, limit: 30 })
+                            });
+                            if (!response.ok) return;
+                            const data = await response.json();
+                            const results = data.results || [];
+                            const items = results.length > 0
+                                ? results.map(result => ({ content: `${result.category} / ${result.prompt_name}`, result: result }))
+                                : [{ content: "No matching prompts", disabled: true }];
+
+                            // Show the matches as a menu; picking one selects it in the dropdowns
+                            new LiteGraph.ContextMenu(items, {
+                                event: event,
+                                title: `${data.total} match${data.total === 1 ? "" : "es"}`,
+                                callback: async (item) => {
+                                    if (!item?.result) return;
+                                    const { category, prompt_name } = item.result;
+                                    if (!categoryWidget.options.values.includes(category)) {
+                                        categoryWidget.options.values.push(category);
+                                    }
+                                    categoryWidget.value = category;
+                                    if (categoryWidget.inputEl) categoryWidget.inputEl.value = category;
+                                    await loadPrompts(category, false, prompt_name);
+                                    newCategoryWidget.value = category;
+                                    if (newCategoryWidget.inputEl) newCategoryWidget.inputEl.value = category;
+                                    newPromptNameWidget.value = prompt_name;
+                                    if (newPromptNameWidget.inputEl) newPromptNameWidget.inputEl.value = prompt_name;
+                                }
+                            });
+                        } catch (error) {
+                            console.error("Error searching prompts:", error);
+                        }
+                    });
+
+                    // Follow changes made in other tabs, by other users or on disk
+                    const onLibraryChange = (event) => {
+                        const change = event.detail;
+                        if (change?.type !== "set") {
+                            // Revalidate; the listing cache turns unchanged lists into 304s
+                            if (categoryWidget.value) {
+                                loadPrompts(categoryWidget.value, true, null, true);
+                            }
+                            fetchListing("/prompt_db_categories", {}).then(data => {
+                                categoryWidget.options.values = [...(data.categories || [])];
+                            }).catch(error => console.error("Error loading categories:", error));
+                            return;
+                        }
+                        
+                        if (!categoryWidget.options.values.includes(change.category)) {
+                            categoryWidget.options.values.push(change.category);
+                        }
+                        if (change.category !== categoryWidget.value) return;
+                        if (!promptNameWidget.options.values.includes(change.prompt_name)) {
+                            promptNameWidget.options.values.push(change.prompt_name);
+                        }
+                        // Show the new text unless the user has unsaved edits of their own
+                        if (change.prompt_name === promptNameWidget.value && promptTextWidget.value === loadedText) {
+                            loadedText = change.prompt_text;
+                            promptTextWidget.value = change.prompt_text;
+                            if (promptTextWidget.inputEl) {
+                                promptTextWidget.inputEl.value = change.prompt_text;
+                            }
+                        }
+                        nodeInstance.setDirtyCanvas(true, true);
+                    };
+                    const onReconnected = () => onLibraryChange({ detail: { type: "reload" } });
+                    api.addEventListener("prompt_db.change", onLibraryChange);
+                    // Changes may have been missed while the socket was down
+                    api.addEventListener("reconnected", onReconnected);
+                    
+                    const originalOnRemoved = this.onRemoved;
+                    this.onRemoved = function() {
+                        api.removeEventListener("prompt_db.change", onLibraryChange);
+                        api.removeEventListener("reconnected", onReconnected);
+                        return originalOnRemoved?.apply(this, arguments);
+                    };
+
                     // Force the node to resize to show the new buttons
                     this.computeSize();
                     this.setDirtyCanvas(true, true);
@@ -0,0 +1,57 @@
+import { api } from "../../scripts/api.js";
+
+// Listing responses cached per request and revalidated against the library
+// version (ETag), so unchanged lists are not downloaded again
+const listingCache = new Map();
+
+export async function fetchListing(route, body) {
+    const key = route + JSON.stringify(body);
+    const cached = listingCache.get(key);
+    const headers = { "Content-Type": "application/json" };
+    if (cached) {
+        headers["If-None-Match"] = cached.etag;
+    }
+    const response = await api.fetchApi(route, {
+        method: "POST",
+        headers: headers,
+        body: JSON.stringify(body)
+    });
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    if (!response.ok) {
+        throw new Error(`${route} failed with status ${response.status}`);
+    }
+    const data = await response.json();
+    const etag = response.headers.get("ETag");
+    if (etag) {
+        listingCache.set(key, { etag: etag, data: data });
+    }
+    return data;
+}
+
+// Apply a live "set" change to the cached listings. An entry that was current
+// just before the change is patched and moved to the new version, so it stays
+// valid without a refetch; filtered or paged entries are left to revalidate.
+export function patchListingCache(change) {
+    if (change.type !== "set") return;
+    for (const [key, cached] of listingCache) {
+        if (cached.etag !== `"${change.previous}"`) continue;
+        const body = JSON.parse(key.slice(key.indexOf("{")));
+        if (body.prefix || body.cursor || body.offset || body.limit) continue;
+        if (key.startsWith("/prompt_db_categories")) {
+            if (!cached.data.categories.includes(change.category)) {
+                cached.data.categories.push(change.category);
+            }
+        } else if (key.startsWith("/prompt_db_prompts") && body.category === change.category) {
+            if (!cached.data.prompts.includes(change.prompt_name)) {
+                cached.data.prompts.push(change.prompt_name);
+            }
+        }
+        cached.etag = `"${change.version}"`;
+    }
+}
+
+// Registered when the module first loads, before any node's listener, so the
+// cache is patched first and only once however many extensions import it
+api.addEventListener("prompt_db.change", (event) => patchListingCache(event.detail));
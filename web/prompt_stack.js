@@ -1,5 +1,6 @@
 import { app } from "../../scripts/app.js";
 import { api } from "../../scripts/api.js";
+import { fetchListing } from "./prompt_db_listing.js";
 
 // Extension for Prompt Stack
 app.registerExtension({
@@ -7,8 +8,14 @@ app.registerExtension({
     
     async beforeRegisterNodeDef(nodeType, nodeData, app) {
         
-        if (nodeData.name === "PromptStack") {
+        if (nodeData.name === "PromptStack" || nodeData.name === "PromptStackSweep") {
             const onNodeCreated = nodeType.prototype.onNodeCreated;
+            // The sweep node outputs every combination, and its entries can select a
+            // whole category with "*"
+            const isSweep = nodeData.name === "PromptStackSweep";
+            const sweepSettings = ["mode", "limit", "sample", "sample_seed"];
+            // Saved values start with the node's fixed widgets, then the entries
+            const firstEntryIndex = Object.keys(nodeData.input?.required ?? {}).length + 1;
             
             nodeType.prototype.onNodeCreated = function() {
                 const r = onNodeCreated ? onNodeCreated.apply(this, arguments) : undefined;
@@ -19,18 +26,8 @@ app.registerExtension({
                 // Function to load categories
                 const loadCategories = async () => {
                     try {
-                        const response = await api.fetchApi("/prompt_db_categories", {
-                            method: "POST",
-                            headers: {
-                                "Content-Type": "application/json",
-                            },
-                            body: JSON.stringify({})
-                        });
-                        
-                        if (response.ok) {
-                            const data = await response.json();
-                            return data.categories || [];
-                        }
+                        const data = await fetchListing("/prompt_db_categories", {});
+                        return [...(data.categories || [])];
                     } catch (error) {
                         console.error("Error loading categories:", error);
                     }
@@ -40,81 +37,102 @@ app.registerExtension({
                 // Function to load prompts for a category
                 const loadPrompts = async (category) => {
                     try {
-                        const response = await api.fetchApi("/prompt_db_prompts", {
-                            method: "POST",
-                            headers: {
-                                "Content-Type": "application/json",
-                            },
-                            body: JSON.stringify({
-                                category: category
-                            })
+                        const data = await fetchListing("/prompt_db_prompts", {
+                            category: category
                         });
-                        
-                        if (response.ok) {
-                            const data = await response.json();
-                            return data.prompts || [];
-                        }
+                        return isSweep ? ["*", ...(data.prompts || [])] : [...(data.prompts || [])];
                     } catch (error) {
                         console.error("Error loading prompts:", error);
                     }
                     return [];
                 };
 
-                // Function to load prompt text
-                const loadPromptText = async (category, promptName) => {
+                // State for the debounced preview: pending timer, in-flight request and a
+                // sequence number so an older response can never overwrite a newer one
+                let previewTimer = null;
+                let previewController = null;
+                let previewSeq = 0;
+
+                // Function to build and update preview
+                const updatePreview = async () => {
+                    const previewWidget = this.widgets.find(w => w.name === 'preview_text');
+                    const separatorWidget = this.widgets.find(w => w.name === 'separator');
+                    
+                    if (!previewWidget || !separatorWidget) return;
+                    
+                    // Send the same prompt_N_* inputs the node receives, so the server stacks them identically
+                    const inputs = {};
+                    for (const widget of this.widgets) {
+                        if (widget.name && widget.name.startsWith('prompt_') &&
+                            (widget.name.endsWith('_category') || widget.name.endsWith('_name') || widget.name.endsWith('_enabled'))) {
+                            inputs[widget.name] = widget.value;
+                        }
+                    }
+
+                    // {{name}} variables come from whatever feeds the "variables" input; the
+                    // preview can only see them when that is a node with a text widget
+                    let variables = "";
+                    const variablesInput = this.inputs?.find(input => input.name === "variables");
+                    if (variablesInput?.link != null) {
+                        const link = app.graph.links[variablesInput.link];
+                        const sourceNode = link ? app.graph.getNodeById(link.origin_id) : null;
+                        const textWidget = sourceNode?.widgets?.find(w => typeof w.value === "string");
+                        variables = textWidget?.value ?? "";
+                    }
+
+                    // Cancel any request that is still in flight
+                    if (previewController) {
+                        previewController.abort();
+                    }
+                    const controller = new AbortController();
+                    previewController = controller;
+                    const seq = ++previewSeq;
+
+                    let result;
                     try {
-                        const response = await api.fetchApi("/prompt_db_text", {
+                        const response = await api.fetchApi("/prompt_stack_preview", {
                             method: "POST",
                             headers: {
                                 "Content-Type": "application/json",
                             },
                             body: JSON.stringify({
-                                category: category,
-                                prompt_name: promptName
-                            })
+                                separator: separatorWidget.value ?? ", ",
+                                inputs: inputs,
+                                variables: variables,
+                                sweep: isSweep ? Object.fromEntries(sweepSettings.map(name =>
+                                    [name, this.widgets.find(w => w.name === name)?.value])) : undefined
+                            }),
+                            signal: controller.signal
                         });
-                        
-                        if (response.ok) {
-                            const data = await response.json();
-                            return data.prompt_text || "";
+
+                        const data = await response.json().catch(() => ({}));
+                        if (data.error) {
+                            // Template problems such as an include cycle
+                            result = `\u26A0 ${data.error}`;
+                        } else if (!response.ok) {
+                            return;
+                        } else if (data.count !== undefined) {
+                            // Sweep: the first few prompts, one per line
+                            const shown = data.stacked_prompts ? data.stacked_prompts.split("\n").length : 0;
+                            result = `${data.count} prompt${data.count === 1 ? "" : "s"}\n${data.stacked_prompts || ""}` +
+                                (data.count > shown ? "\n\u2026" : "");
+                        } else {
+                            result = data.stacked_prompts || "";
                         }
                     } catch (error) {
-                        console.error("Error loading prompt text:", error);
-                    }
-                    return "";
-                };
-                
-                // Function to build and update preview
-                const updatePreview = async () => {
-                    const previewWidget = this.widgets.find(w => w.name === 'preview_text');
-                    const separatorWidget = this.widgets.find(w => w.name === 'separator');
-                    
-                    if (!previewWidget || !separatorWidget) return;
-                    
-                    const separator = separatorWidget.value || ", ";
-                    const stacked_prompts = [];
-                    
-                    // Find all prompt entries by scanning for enabled widgets
-                    const enabledWidgets = this.widgets.filter(w => w.name && w.name.startsWith('prompt_') && w.name.endsWith('_enabled'));
-                    
-                    for (const enabledWidget of enabledWidgets) {
-                        const entryNum = enabledWidget.name.split('_')[1];
-                        const categoryWidget = this.widgets.find(w => w.name === `prompt_${entryNum}_category`);
-                        const promptWidget = this.widgets.find(w => w.name === `prompt_${entryNum}_name`);
-                        
-                        if (enabledWidget.value && categoryWidget && promptWidget && categoryWidget.value && promptWidget.value) {
-                            try {
-                                const promptText = await loadPromptText(categoryWidget.value, promptWidget.value);
-                                if (promptText) {
-                                    stacked_prompts.push(promptText);
-                                }
-                            } catch (error) {
-                                console.error("Error loading prompt text for preview:", error);
-                            }
+                        if (error.name !== "AbortError") {
+                            console.error("Error loading prompt text for preview:", error);
+                        }
+                        return;
+                    } finally {
+                        if (previewController === controller) {
+                            previewController = null;
                         }
                     }
-                    
-                    const result = stacked_prompts.join(separator);
+
+                    // A newer preview was requested while this one was loading
+                    if (seq !== previewSeq) return;
+
                     previewWidget.value = result;
                     
                     // Update the DOM element if it exists
@@ -122,6 +140,17 @@ app.registerExtension({
                         previewWidget.inputEl.value = result;
                     }
                 };
+
+                // Debounce preview updates so a burst of edits produces a single request
+                const schedulePreview = () => {
+                    if (previewTimer) {
+                        clearTimeout(previewTimer);
+                    }
+                    previewTimer = setTimeout(() => {
+                        previewTimer = null;
+                        updatePreview();
+                    }, 150);
+                };
                 
                 // Function to update category dropdown
                 const updateCategoryDropdown = async (categoryWidget, restoredCategoryName = null) => {
@@ -200,7 +229,7 @@ app.registerExtension({
                                 originalPromptCallback.call(this, value);
                             }
                             // Auto-update preview when prompt selection changes
-                            setTimeout(() => updatePreview(), 100);
+                            schedulePreview();
                         };
                         
                         // Add enabled widget callback if it exists
@@ -211,7 +240,7 @@ app.registerExtension({
                                     originalEnabledCallback.call(this, value);
                                 }
                                 // Auto-update preview when enabled state changes
-                                setTimeout(() => updatePreview(), 100);
+                                schedulePreview();
                             };
                         }
                         
@@ -263,7 +292,44 @@ app.registerExtension({
                     }
                     
                     // Update preview after refreshing dropdowns
-                    setTimeout(() => updatePreview(), 100);
+                    schedulePreview();
+                };
+                
+                // Follow changes made in other tabs, by other users or on disk
+                const onLibraryChange = (event) => {
+                    const change = event.detail;
+                    if (change?.type !== "set") {
+                        refreshAllDropdowns();
+                        return;
+                    }
+                    
+                    const categoryWidgets = this.widgets.filter(w => w.name && w.name.startsWith("prompt_") && w.name.endsWith("_category"));
+                    for (const categoryWidget of categoryWidgets) {
+                        const entryNum = categoryWidget.name.split('_')[1];
+                        const promptWidget = this.widgets.find(w => w.name === `prompt_${entryNum}_name`);
+                        
+                        if (!categoryWidget.options.values.includes(change.category)) {
+                            categoryWidget.options.values.push(change.category);
+                        }
+                        if (!promptWidget || categoryWidget.value !== change.category) continue;
+                        if (!promptWidget.options.values.includes(change.prompt_name)) {
+                            promptWidget.options.values.push(change.prompt_name);
+                        }
+                    }
+                    
+                    // Any prompt may be pulled in by a {{category/name}} include, so re-stack
+                    schedulePreview();
+                };
+                const onReconnected = () => refreshAllDropdowns();
+                api.addEventListener("prompt_db.change", onLibraryChange);
+                // Changes may have been missed while the socket was down
+                api.addEventListener("reconnected", onReconnected);
+                
+                const originalOnRemoved = this.onRemoved;
+                this.onRemoved = function() {
+                    api.removeEventListener("prompt_db.change", onLibraryChange);
+                    api.removeEventListener("reconnected", onReconnected);
+                    return originalOnRemoved?.apply(this, arguments);
                 };
                 
                 // Function to add a new prompt entry (now supports initial values and entry number for restore)
@@ -334,7 +400,19 @@ app.registerExtension({
                                     originalSeparatorCallback.call(this, value);
                                 }
                                 // Auto-update preview when separator changes
-                                setTimeout(() => updatePreview(), 100);
+                                schedulePreview();
+                            };
+                        }
+                        
+                        for (const name of isSweep ? sweepSettings : []) {
+                            const settingWidget = this.widgets.find(w => w.name === name);
+                            if (!settingWidget) continue;
+                            const originalSettingCallback = settingWidget.callback;
+                            settingWidget.callback = function(value) {
+                                if (originalSettingCallback) {
+                                    originalSettingCallback.call(this, value);
+                                }
+                                schedulePreview();
                             };
                         }
                         
@@ -451,9 +529,10 @@ app.registerExtension({
                     console.log('[PromptStack] widgets_values:', values);
                     let promptEntries = [];
                     // Skip separator (index 0) and preview_text (index 1), start parsing from index 2
+                    // (the sweep node has its settings before the entries, hence firstEntryIndex)
                     // Note: Reload button is not serialized, so it won't be in the values array
                     // Order is: category, name, enabled (matching Python backend)
-                    for (let i = 3; i + 3 < values.length; i += 4) {
+                    for (let i = firstEntryIndex; i + 3 < values.length; i += 4) {
                         promptEntries.push({
                             category: values[i + 1],
                             name: values[i + 2],